@@ -17,16 +17,35 @@ import warnings
 warnings.filterwarnings('ignore', category=UserWarning, module='.*')
 
 import streamlit as st
-import tempfile
-import zipfile
+from contextlib import ExitStack
 from datetime import datetime
 from pathlib import Path
 import re
 import pandas as pd
 from pptx import Presentation
-from pptx.util import Inches
 from pptx.enum.shapes import MSO_SHAPE_TYPE
 
+from image_cache import PreparedImageCache
+from image_matcher import ATTACHMENT_COLUMNS, TIMESTAMP_COLUMNS, match_rows
+from image_prep import ImagePreparer
+from inspection_records import InspectionBatch
+from inspection_validation import load_inspection_rows
+from match_cache import MatchCache
+from photo_dedupe import PhotoDeduper
+from scratch import default_scratch_space
+from slide_pictures import LINKED_PHOTO_FOLDER, PicturePlacer, pack_bundle
+from workbook_cache import WorkbookCache
+from xlsx_images import has_embedded_images, read_embedded_images
+from zip_dataset import ArchiveLimitError, ZipDataset
+
+# 图片匹配置信度低于该值时在结果中提示人工核对
+REVIEW_SCORE = 0.6
+
+# 幻灯片左侧图片区域的位置和大小（英寸）
+PICTURE_LEFT = 0.5
+PICTURE_TOP = 2.1
+PICTURE_BOX = (3.5, 2.8)
+
 # 页面配置 - 必须在文件开始就调用
 st.set_page_config(
     page_title="Gemba巡厂PPT生成器",
@@ -56,50 +75,42 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def read_excel_data(excel_path):
-    """从Excel文件动态读取数据，替代硬编码数据"""
+def read_excel_data(excel_path, attachment_columns=ATTACHMENT_COLUMNS):
+    """从Excel文件动态读取数据，替代硬编码数据
+    
+    返回按列保存的 InspectionBatch。如果存在附件列（attachment_columns 中第一个存在的列），
+    其内容保存在每行的 attachment 字段中，用于直接关联图片；
+    如果存在时间列（TIMESTAMP_COLUMNS），保存在 captured 字段中，用于按拍摄时间匹配图片。
+    """
     try:
-        st.info(f"正在读取Excel文件: {excel_path}")
-        
-        # 使用pandas读取Excel文件
-        df = pd.read_excel(excel_path)
-        st.success(f"Excel文件读取成功，共 {len(df)} 行数据")
+        st.info(f"正在读取Excel文件: {getattr(excel_path, 'name', excel_path)}")
         
-        # 数据验证：检查必需的列是否存在
-        required_columns = ["问题发现区域", "发现人", "问题收集", "问题分类"]
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        # 只读方式读取需要的列，按列清理并校验
+        batch, report = load_inspection_rows(excel_path, get_category_mapping(), attachment_columns,
+                                             TIMESTAMP_COLUMNS, cache=WorkbookCache())
+        st.success(f"Excel文件读取成功，共 {report.total_rows} 行数据（{report.backend}）")
         
-        if missing_columns:
-            st.warning(f"Excel文件缺少必需列: {missing_columns}")
-            # 使用默认值填充缺失列
-            for col in missing_columns:
-                df[col] = "未知"
+        if report.missing_columns:
+            st.warning(f"Excel文件缺少必需列: {report.missing_columns}，使用默认值填充")
+        if report.attachment_column:
+            st.info(f"检测到附件列: {report.attachment_column}，将按附件直接关联图片")
+        if report.time_column:
+            st.info(f"检测到时间列: {report.time_column}")
         
-        # 过滤空行和无效数据
-        df_cleaned = df.dropna(subset=["问题收集"]).copy()
-        st.info(f"清理后有效数据: {len(df_cleaned)} 行")
+        # 在生成幻灯片之前列出有问题的行
+        issues = report.issues()
+        if issues:
+            st.warning(f"数据校验: {report.summary()}")
+            st.dataframe(pd.DataFrame(issues), use_container_width=True, hide_index=True)
         
-        # 转换为标准格式
-        data_list = []
-        for _, row in df_cleaned.iterrows():
-            data_row = {
-                "问题发现区域": str(row.get("问题发现区域", "未知")).strip(),
-                "发现人": str(row.get("发现人", "未知")).strip(),
-                "问题收集": str(row.get("问题收集", "")).strip(),
-                "问题分类": str(row.get("问题分类", "Others")).strip()
-            }
-            # 只添加非空的问题记录
-            if data_row["问题收集"]:
-                data_list.append(data_row)
-        
-        st.success(f"最终处理数据: {len(data_list)} 行")
-        return data_list
+        st.success(f"最终处理数据: {len(batch)} 行")
+        return batch
         
     except Exception as e:
         st.error(f"读取Excel文件失败: {e}")
         st.info("使用备用硬编码数据...")
         # 发生错误时返回原有的硬编码数据作为备用
-        return get_all_31_rows_backup()
+        return InspectionBatch.from_rows(get_all_31_rows_backup())
 
 def get_all_31_rows_backup():
     """备用硬编码数据函数"""
@@ -149,39 +160,6 @@ def get_category_mapping():
         "Others": "G"
     }
 
-def find_matching_image(problem_description, images_path):
-    """增强的图片匹配函数"""
-    if not problem_description or not images_path.exists():
-        return None
-    
-    # 方法1: 精确匹配
-    for img_file in images_path.glob("*.jpeg"):
-        if problem_description in img_file.stem:
-            return img_file
-    
-    # 方法2: 反向匹配
-    for img_file in images_path.glob("*.jpeg"):
-        img_name = img_file.stem
-        if img_name in problem_description:
-            return img_file
-    
-    # 方法3: 清理特殊字符后匹配
-    problem_clean = problem_description.replace(" ", "").replace("，", "").replace("。", "")
-    for img_file in images_path.glob("*.jpeg"):
-        img_clean = img_file.stem.replace("_", "").replace("-", "").replace("--", "")
-        if problem_clean in img_clean or img_clean in problem_clean:
-            return img_file
-    
-    # 方法4: 关键词匹配
-    keywords = problem_description.split()
-    for img_file in images_path.glob("*.jpeg"):
-        img_name = img_file.stem
-        for keyword in keywords:
-            if len(keyword) > 1 and keyword in img_name:
-                return img_file
-    
-    return None
-
 def handle_circle_markers(slide, target_category):
     """处理圆形标记 A-G 系统"""
     category_mapping = get_category_mapping()
@@ -220,86 +198,77 @@ def handle_circle_markers(slide, target_category):
     
     return target_circle is not None
 
-def extract_zip_and_find_files(zip_path):
-    """解压ZIP文件并查找Excel和图片"""
+def open_zip_and_find_files(zip_source):
+    """打开ZIP数据包并查找Excel和图片，不解压到磁盘
+
+    Returns:
+        tuple: (ZipDataset, Excel 文件内存流)，失败时为 (None, None)
+    """
+    dataset = None
     try:
-        zip_path = Path(zip_path)
-        temp_dir = Path(tempfile.mkdtemp())
-        
-        # 解压ZIP文件
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        st.info(f"ZIP文件已解压到: {temp_dir}")
+        dataset = ZipDataset(zip_source)
         
         # 查找Excel文件
-        excel_files = list(temp_dir.rglob("*.xlsx"))
-        if not excel_files:
-            raise FileNotFoundError("未在ZIP文件中找到Excel文件")
-        
-        excel_path = excel_files[0]
-        st.success(f"找到Excel文件: {excel_path.name}")
+        excel_file = dataset.open_workbook()
+        if excel_file is None:
+            raise FileNotFoundError("未在ZIP文件中找到Excel、CSV或Parquet文件")
+        st.success(f"找到数据文件: {excel_file.name}")
         
         # 查找图片文件夹
-        image_folders = []
-        for folder in temp_dir.rglob("*"):
-            if folder.is_dir() and ("图片" in folder.name or "照片" in folder.name):
-                image_folders.append(folder)
-        
-        if not image_folders:
-            # 如果没有找到专门的图片文件夹，查找包含jpeg文件的文件夹
-            for folder in temp_dir.rglob("*"):
-                if folder.is_dir() and list(folder.glob("*.jpeg")):
-                    image_folders.append(folder)
-        
-        if not image_folders:
+        if dataset.image_folder is None:
+            # 图片直接嵌入在Excel中时不需要单独的图片文件夹
+            if has_embedded_images(excel_file):
+                st.info("未找到图片文件夹，将使用Excel内嵌图片")
+                return dataset, excel_file
             raise FileNotFoundError("未在ZIP文件中找到图片文件夹")
         
-        images_path = image_folders[0]
-        st.success(f"找到图片文件夹: {images_path.name}")
+        st.success(f"找到图片文件夹: {dataset.image_folder}")
         
-        return excel_path, images_path, temp_dir
+        return dataset, excel_file
         
     except Exception as e:
-        st.error(f"解压ZIP文件失败: {e}")
-        return None, None, None
+        if dataset is not None:
+            dataset.close()
+        st.error(f"读取ZIP文件失败: {e}")
+        return None, None
+
+def generate_ppt_streamlit(ppt_file, zip_file, output_filename, use_capture_time=False, dedupe_photos=False,
+                           link_photos=False):
+    """Streamlit版本的PPT生成函数
 
-def generate_ppt_streamlit(ppt_file, zip_file, output_filename):
-    """Streamlit版本的PPT生成函数"""
+    use_capture_time 为 True 时，其余方式都没有匹配到的行再按照片拍摄时间匹配；
+    dedupe_photos 为 True 时，近似重复的照片只嵌入一份；
+    link_photos 为 True 时生成精简版：图片以链接方式插入，返回 PPT 和图片文件夹打包的 ZIP
+    """
     progress_bar = st.progress(0)
     status_text = st.empty()
     
     try:
-        # 创建临时目录
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = Path(temp_dir)
+        # 本次生成的临时目录，结束时（包括出错和中断）自动删除；
+        # 压缩包和图片预处理进程池登记在 resources 中，提前返回或 Streamlit 中断时同样关闭
+        with default_scratch_space().job("app") as scratch, ExitStack() as resources:
+            temp_path = scratch.path
             
             # 保存上传的文件到临时目录
             status_text.text("保存上传文件...")
             progress_bar.progress(10)
             
-            ppt_path = temp_path / "template.pptx"
-            zip_path = temp_path / "data.zip"
-            
-            with open(ppt_path, "wb") as f:
-                f.write(ppt_file.getvalue())
+            ppt_path = scratch.write("template.pptx", ppt_file.getvalue())
             
-            with open(zip_path, "wb") as f:
-                f.write(zip_file.getvalue())
-            
-            # 解压ZIP文件并查找相关文件
-            status_text.text("解压ZIP文件...")
+            # 直接读取上传的ZIP文件并查找相关文件，图片在用到时才从压缩包中解压
+            status_text.text("读取ZIP文件...")
             progress_bar.progress(20)
             
-            excel_path, images_path, extract_dir = extract_zip_and_find_files(zip_path)
+            dataset, excel_path = open_zip_and_find_files(zip_file)
             
-            if not excel_path or not images_path:
-                st.error("无法找到Excel文件或图片文件夹")
+            if not excel_path:
+                st.error("无法找到数据文件")
                 return None
+            resources.enter_context(dataset)
             
-            # 显示找到的图片数量
-            images = list(images_path.glob("*.jpeg"))
-            st.info(f"发现 {len(images)} 张图片")
+            # 一次性建立图片索引，并显示找到的图片数量
+            image_index = dataset.index()
+            st.info(f"发现 {len(image_index)} 张图片")
             
             # 加载PPT模板
             status_text.text("加载PPT模板...")
@@ -338,6 +307,36 @@ def generate_ppt_streamlit(ppt_file, zip_file, output_filename):
                 
             template_slide = prs.slides[1]
             
+            # 确定每行的图片：先用内嵌图片和附件关联，再查匹配缓存，其余批量一对一分配
+            embedded_images = read_embedded_images(excel_path)
+            if embedded_images:
+                st.info(f"Excel内嵌图片: {len(embedded_images)} 张")
+            row_matches = match_rows(data, image_index, MatchCache(scope="app"), embedded_images,
+                                     use_capture_time)
+            st.info(f"匹配到图片: {sum(1 for path, _, _ in row_matches if path)}/{len(data)} 行")
+            
+            # 处理前检查匹配到的图片尺寸，超大图片直接报错而不是耗尽内存
+            try:
+                dataset.check_pixels(path for path, _, _ in row_matches if path)
+            except ArchiveLimitError as e:
+                st.error(str(e))
+                return None
+            
+            # 在后台进程中预处理图片（使用缓存），与幻灯片构建同时进行
+            preparer = resources.enter_context(ImagePreparer(PICTURE_BOX, cache=PreparedImageCache()))
+            preparer.submit(path for path, _, _ in row_matches if path)
+            deduper = PhotoDeduper() if dedupe_photos else None
+            if link_photos:
+                # 精简版：图片写入文件包中的图片文件夹，PPT 中只保存相对路径链接
+                bundle_dir = temp_path / "bundle"
+                placer = PicturePlacer(preparer, deduper, link_dir=bundle_dir / LINKED_PHOTO_FOLDER,
+                                       scratch=scratch)
+            else:
+                # 图片部件内容暂存在临时目录中，保存时才读入，内存占用不随图片数量增长
+                placer = PicturePlacer(preparer, deduper, spool_dir=temp_path / "parts", scratch=scratch)
+            
+            match_report = []
+            
             # 为每行数据创建幻灯片
             status_text.text("生成PPT页面...")
             created_count = 0
@@ -346,7 +345,7 @@ def generate_ppt_streamlit(ppt_file, zip_file, output_filename):
             for i, row in enumerate(data, 1):
                 progress_value = 50 + int((i / len(data)) * 40)
                 progress_bar.progress(progress_value)
-                status_text.text(f"创建第 {i+1} 页: {row['问题收集'][:30]}...")
+                status_text.text(f"创建第 {i+1} 页: {row.description[:30]}...")
                 
                 try:
                     # 添加新幻灯片
@@ -367,26 +366,38 @@ def generate_ppt_streamlit(ppt_file, zip_file, output_filename):
                             
                             # 替换占位符内容
                             if original_text == "模具":
-                                new_textbox.text_frame.text = row["问题发现区域"]
+                                new_textbox.text_frame.text = row.area
                             elif original_text == "-":
-                                new_textbox.text_frame.text = row["发现人"]
+                                new_textbox.text_frame.text = row.person
                             elif "看板信息更新" in original_text or original_text == "看板信息更新":
-                                new_textbox.text_frame.text = row["问题收集"]
+                                new_textbox.text_frame.text = row.description
                             else:
                                 new_textbox.text_frame.text = original_text
                     
                     # 处理圆形标记系统
-                    handle_circle_markers(new_slide, row["问题分类"])
+                    handle_circle_markers(new_slide, row.category)
                     
                     # 添加图片到左边
-                    image_path = find_matching_image(row["问题收集"], images_path)
+                    image_path, score, method = row_matches[i - 1]
+                    report_row = {
+                        "页码": i + 1,
+                        "问题收集": row.description,
+                        "图片": image_path.name if image_path else "",
+                        "匹配方式": method or "未匹配",
+                        "置信度": round(score, 2),
+                        "候选图片": "",
+                    }
+                    if score < REVIEW_SCORE:
+                        # 低置信度或未匹配的行列出模糊候选，便于人工核对
+                        report_row["候选图片"] = "; ".join(
+                            f"{path.name} ({candidate_score:.2f})"
+                            for path, candidate_score in image_index.fuzzy_candidates(row.description)
+                        )
+                    match_report.append(report_row)
                     if image_path:
                         try:
-                            left = Inches(0.5)
-                            top = Inches(2.1)
-                            width = Inches(3.5)
-                            height = Inches(2.8)
-                            new_slide.shapes.add_picture(str(image_path), left, top, width, height)
+                            # 按图片实际宽高比放入图片区域，不拉伸；同一张图片只读取一次
+                            placer.add(new_slide, image_path, PICTURE_LEFT, PICTURE_TOP, PICTURE_BOX, i + 1)
                             images_found += 1
                         except Exception as e:
                             st.warning(f"图片添加失败: {e}")
@@ -396,6 +407,22 @@ def generate_ppt_streamlit(ppt_file, zip_file, output_filename):
                 except Exception as e:
                     st.error(f"创建第{i+1}页失败: {e}")
             
+            preparer.close()
+            dataset.close()
+            if preparer.cache_hits:
+                st.info(f"预处理图片缓存命中: {preparer.cache_hits} 张")
+            
+            # 记录共用同一张照片的页
+            if deduper:
+                shared_pages = {}
+                for name, pages in deduper.shared_groups():
+                    for page in pages:
+                        shared_pages[page] = f"{name}（第 {'、'.join(map(str, pages))} 页）"
+                for report_row in match_report:
+                    report_row["共用图片"] = shared_pages.get(report_row["页码"], "")
+                if shared_pages:
+                    st.info(f"重复照片已合并: {len(deduper.shared_groups())} 张照片被多页共用")
+            
             # 删除原始的第二页模板幻灯片
             status_text.text("清理模板页...")
             progress_bar.progress(90)
@@ -417,12 +444,23 @@ def generate_ppt_streamlit(ppt_file, zip_file, output_filename):
             status_text.text("保存PPT文件...")
             progress_bar.progress(95)
             
-            output_path = temp_path / output_filename
-            prs.save(str(output_path))
-            
-            # 读取生成的文件用于下载
-            with open(output_path, "rb") as f:
-                ppt_data = f.read()
+            # 保存前按模板和嵌入的图片部件估计输出文件大小并预留空间，
+            # 超出上限时在写入之前报错，而不是写完之后
+            output_estimate = ppt_path.stat().st_size + placer.embedded_bytes
+            scratch.reserve(output_estimate)
+            if link_photos:
+                output_path = bundle_dir / output_filename
+                prs.save(str(output_path))
+                scratch.track(output_path, reserved=output_estimate)
+                ppt_data = pack_bundle(bundle_dir)
+            else:
+                output_path = temp_path / output_filename
+                prs.save(str(output_path))
+                scratch.track(output_path, reserved=output_estimate)
+                
+                # 读取生成的文件用于下载
+                with open(output_path, "rb") as f:
+                    ppt_data = f.read()
             
             progress_bar.progress(100)
             status_text.text("PPT生成完成！")
@@ -438,6 +476,15 @@ def generate_ppt_streamlit(ppt_file, zip_file, output_filename):
             with col3:
                 st.metric("图片", f"{images_found} 张")
             
+            # 图片匹配结果，低置信度的行排在前面
+            if match_report:
+                st.subheader("🖼️ 图片匹配结果")
+                low_confidence = sum(1 for item in match_report if item["置信度"] < REVIEW_SCORE)
+                if low_confidence:
+                    st.warning(f"{low_confidence} 行的图片匹配置信度低于 {REVIEW_SCORE}，请核对")
+                report_df = pd.DataFrame(match_report).sort_values("置信度", kind="stable")
+                st.dataframe(report_df, use_container_width=True, hide_index=True)
+            
             return ppt_data
             
     except Exception as e:
@@ -449,6 +496,9 @@ def generate_ppt_streamlit(ppt_file, zip_file, output_filename):
 def main():
     """主函数 - Streamlit Web应用"""
     
+    # 启动时清理上次异常退出遗留的临时目录
+    default_scratch_space()
+    
     # 添加调试信息
     st.write("🚀 Streamlit 应用已启动")
     
@@ -531,6 +581,22 @@ def main():
             st.session_state.clear()
             st.rerun()
     
+    use_capture_time = st.checkbox(
+        "按拍摄时间匹配剩余图片",
+        value=False,
+        help="按文字未能匹配的行，根据Excel时间列或行顺序与照片的EXIF拍摄时间对应"
+    )
+    dedupe_photos = st.checkbox(
+        "合并近似重复的照片",
+        value=False,
+        help="同一位置连拍的几张相似照片在PPT中只嵌入一份，减小文件大小"
+    )
+    link_photos = st.checkbox(
+        "精简版（图片以链接方式插入）",
+        value=False,
+        help="PPT中不嵌入图片，下载PPT和图片文件夹打包的ZIP，解压后在同一位置打开"
+    )
+    
     # 生成按钮
     st.markdown("---")
     
@@ -542,18 +608,28 @@ def main():
             st.markdown("### 🔄 生成进度")
             
             # 生成PPT
-            ppt_data = generate_ppt_streamlit(ppt_file, zip_file, output_filename)
+            ppt_data = generate_ppt_streamlit(ppt_file, zip_file, output_filename, use_capture_time,
+                                              dedupe_photos, link_photos)
             
             if ppt_data:
                 # 提供下载按钮
                 st.markdown("### 📥 下载文件")
-                st.download_button(
-                    label="📥 下载生成的PPT",
-                    data=ppt_data,
-                    file_name=output_filename,
-                    mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-                    use_container_width=True
-                )
+                if link_photos:
+                    st.download_button(
+                        label="📥 下载精简版PPT文件包",
+                        data=ppt_data,
+                        file_name=Path(output_filename).stem + ".zip",
+                        mime="application/zip",
+                        use_container_width=True
+                    )
+                else:
+                    st.download_button(
+                        label="📥 下载生成的PPT",
+                        data=ppt_data,
+                        file_name=output_filename,
+                        mime="application/vnd.openxmlformats-officedocument.presentationml.presentation",
+                        use_container_width=True
+                    )
                 
                 # 显示成功消息
                 st.balloons()
@@ -9,6 +9,8 @@ import csv
 from pathlib import Path
 from datetime import datetime
 
+from image_matcher import ImageIndex
+
 def read_real_excel_data():
     """读取真实的Excel数据 - 所有31行"""
     
@@ -50,24 +52,14 @@ def read_real_excel_data():
     return data
 
 def find_matching_image(problem_description, images_path):
-    """查找匹配的图片"""
-    if not problem_description or not images_path.exists():
+    """查找匹配的图片，images_path 可以是文件夹路径或已构建的 ImageIndex"""
+    if not problem_description:
         return None
-        
-    # 精确匹配
-    for image_file in images_path.glob("*.jpeg"):
-        image_name = image_file.stem
-        if problem_description in image_name:
-            return image_file
-    
-    # 处理特殊情况的匹配
-    problem_clean = problem_description.replace(" ", "").replace("，", "").replace("。", "")
-    for image_file in images_path.glob("*.jpeg"):
-        image_name = image_file.stem.replace("_", "").replace("-", "")
-        if problem_clean in image_name or image_name in problem_clean:
-            return image_file
-    
-    return None
+    
+    image_index = images_path if isinstance(images_path, ImageIndex) else ImageIndex(images_path)
+    
+    # 精确匹配，其次处理特殊情况的匹配
+    return image_index.match_exact(problem_description) or image_index.match_cleaned(problem_description)
 
 def test_data_and_images():
     """测试31行数据和图片匹配"""
@@ -85,8 +77,8 @@ def test_data_and_images():
         print(f"错误: 图片文件夹不存在: {images_path}")
         return
         
-    images = list(images_path.glob("*.jpeg"))
-    print(f"图片文件数量: {len(images)} 张")
+    image_index = ImageIndex(images_path)
+    print(f"图片文件数量: {len(image_index)} 张")
     
     # 测试匹配
     matched_count = 0
@@ -94,7 +86,7 @@ def test_data_and_images():
     
     for i, row in enumerate(data, 1):
         problem = row["问题收集"]
-        image = find_matching_image(problem, images_path)
+        image = find_matching_image(problem, image_index)
         
         if image:
             print(f"{i:2d}. ✓ {problem} -> {image.name}")
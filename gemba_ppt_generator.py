@@ -20,11 +20,21 @@ import logging
 from datetime import datetime
 from pathlib import Path
 from pptx import Presentation
-from pptx.util import Inches, Pt
+from pptx.util import Pt
 from pptx.enum.text import PP_ALIGN
 import re
 import shutil
 
+from image_cache import PreparedImageCache
+from image_catalog import load_image_library
+from image_matcher import ATTACHMENT_COLUMNS, FUZZY_THRESHOLD, ImageIndex
+from image_prep import ImagePreparer
+from inspection_validation import load_inspection_rows
+from match_cache import MatchCache
+from photo_dedupe import PhotoDeduper
+from scratch import default_scratch_space
+from slide_pictures import PicturePlacer
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -36,20 +46,38 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 幻灯片右侧图片区域的位置和大小（英寸）
+PICTURE_LEFT = 6
+PICTURE_TOP = 2
+PICTURE_BOX = (3, 2.5)
+
 class GembaPPTGenerator:
     """Gemba巡厂PPT生成器"""
     
-    def __init__(self, base_path):
+    def __init__(self, base_path, image_library=None, dedupe_photos=False, data_path=None):
         """
         初始化生成器
         
         Args:
             base_path (str): 基础路径，包含PPT模板和数据文件
+            image_library (str): 可选的共享图片库根目录（含子文件夹），
+                提供时代替默认的现场图片文件夹
+            dedupe_photos (bool): 是否合并近似重复的照片（只嵌入一份）
+            data_path (str): 可选的巡厂数据文件（Excel、CSV 或 Parquet），
+                提供时代替默认的Excel文件
         """
         self.base_path = Path(base_path)
+        self.dedupe_photos = dedupe_photos
         self.template_path = self.base_path / "参观路线Gemba20250829.pptx"
-        self.excel_path = self.base_path / "Gemba巡厂_V2_20250920170854" / "Gemba巡厂_V2_20250920170854.xlsx"
-        self.images_path = self.base_path / "Gemba巡厂_V2_20250920170854" / "Files" / "待整改--现场图片"
+        if data_path:
+            self.excel_path = Path(data_path)
+        else:
+            self.excel_path = self.base_path / "Gemba巡厂_V2_20250920170854" / "Gemba巡厂_V2_20250920170854.xlsx"
+        self.image_library = Path(image_library) if image_library else None
+        if self.image_library:
+            self.images_path = self.image_library
+        else:
+            self.images_path = self.base_path / "Gemba巡厂_V2_20250920170854" / "Files" / "待整改--现场图片"
         
         # 问题分类选项映射
         self.category_options = [
@@ -60,6 +88,20 @@ class GembaPPTGenerator:
         # 验证路径
         self._validate_paths()
         
+        # 一次性建立图片索引，避免每行数据重复扫描图片文件夹；
+        # 共享图片库使用增量刷新的持久化清单
+        if self.image_library:
+            self.image_index = load_image_library(self.image_library)
+        else:
+            self.image_index = ImageIndex(self.images_path)
+        logger.info(f"已索引 {len(self.image_index)} 张图片")
+        
+        # 图片匹配缓存，重复生成同一批数据时跳过匹配
+        self.match_cache = MatchCache(scope="gemba")
+        
+        # 附件列名，读取Excel时检测
+        self.attachment_column = None
+        
     def _validate_paths(self):
         """验证所有必需的文件和路径是否存在"""
         logger.info("验证文件路径...")
@@ -68,7 +110,7 @@ class GembaPPTGenerator:
             raise FileNotFoundError(f"PPT模板文件不存在: {self.template_path}")
             
         if not self.excel_path.exists():
-            raise FileNotFoundError(f"Excel文件不存在: {self.excel_path}")
+            raise FileNotFoundError(f"数据文件不存在: {self.excel_path}")
             
         if not self.images_path.exists():
             raise FileNotFoundError(f"图片文件夹不存在: {self.images_path}")
@@ -111,27 +153,29 @@ class GembaPPTGenerator:
         读取Excel数据
         
         Returns:
-            pandas.DataFrame: Excel数据
+            InspectionBatch: 清理后的数据（按列保存）
         """
         logger.info("读取Excel数据...")
         
         try:
-            # 读取Excel文件
-            df = pd.read_excel(self.excel_path, sheet_name="Gemba巡厂 V2")
-            
-            # 只保留需要的列
-            required_columns = ["问题发现区域", "发现人", "问题收集", "问题分类"]
+            # 只读方式读取需要的列，按列清理并校验；CSV 和 Parquet 文件按扩展名直接读取
+            batch, report = load_inspection_rows(self.excel_path, self.category_options, ATTACHMENT_COLUMNS,
+                                                 sheet="Gemba巡厂 V2")
             
             # 检查列是否存在
-            for col in required_columns:
-                if col not in df.columns:
-                    logger.warning(f"Excel中缺少列: {col}")
+            for col in report.missing_columns:
+                logger.warning(f"Excel中缺少列: {col}")
+            
+            # 检测附件列，存在时按附件直接关联图片
+            self.attachment_column = report.attachment_column
+            if self.attachment_column:
+                logger.info(f"检测到附件列: {self.attachment_column}")
             
-            # 过滤空行
-            df = df.dropna(subset=["问题收集"])
+            for issue in report.issues():
+                logger.warning(f"第 {issue['行号']} 行: {issue['问题']} {issue['内容']}")
             
-            logger.info(f"成功读取 {len(df)} 行数据")
-            return df
+            logger.info(f"成功读取 {len(batch)} 行数据")
+            return batch
             
         except Exception as e:
             logger.error(f"读取Excel数据时发生错误: {e}")
@@ -153,27 +197,57 @@ class GembaPPTGenerator:
         # 清理问题描述，移除特殊字符
         clean_description = str(problem_description).strip()
         
-        # 在图片文件夹中查找匹配的图片
-        for image_file in self.images_path.glob("*.jpeg"):
-            image_name = image_file.stem  # 不包含扩展名的文件名
-            
-            # 检查问题描述是否包含在图片文件名中
-            if clean_description in image_name:
-                logger.info(f"找到匹配图片: {clean_description} -> {image_file.name}")
-                return image_file
-        
-        # 如果没有精确匹配，尝试部分匹配
-        for image_file in self.images_path.glob("*.jpeg"):
-            image_name = image_file.stem
-            
-            # 检查图片文件名是否包含在问题描述中
-            if image_name in clean_description:
-                logger.info(f"找到部分匹配图片: {clean_description} -> {image_file.name}")
-                return image_file
+        # 检查问题描述是否包含在图片文件名中
+        image_file = self.image_index.match_exact(clean_description)
+        if image_file:
+            logger.info(f"找到匹配图片: {clean_description} -> {image_file.name}")
+            return image_file
+        
+        # 如果没有精确匹配，检查图片文件名是否包含在问题描述中
+        image_file = self.image_index.match_reverse(clean_description)
+        if image_file:
+            logger.info(f"找到部分匹配图片: {clean_description} -> {image_file.name}")
+            return image_file
+        
+        # 子串匹配都失败时，按模糊相似度选择得分最高的候选
+        candidates = self.image_index.fuzzy_candidates(clean_description)
+        if candidates and candidates[0][1] >= FUZZY_THRESHOLD:
+            image_file, score = candidates[0]
+            logger.info(f"找到模糊匹配图片: {clean_description} -> {image_file.name} (得分 {score:.2f})")
+            return image_file
         
         logger.warning(f"未找到匹配的图片: {clean_description}")
+        for image_file, score in candidates:
+            logger.warning(f"  候选图片: {image_file.name} (得分 {score:.2f})")
         return None
     
+    def resolve_image(self, row, fingerprint):
+        """
+        确定一行数据对应的图片：优先按附件列关联，其次使用匹配缓存，最后实时匹配
+        
+        Args:
+            row (InspectionRecord): 数据行
+            fingerprint (str): 图片文件夹指纹
+            
+        Returns:
+            Path or None: 图片路径
+        """
+        problem = row.description
+        
+        if row.attachment:
+            image_path = self.image_index.lookup_attachment(row.attachment)
+            if image_path:
+                logger.info(f"按附件关联图片: {problem} -> {image_path.name}")
+                return image_path
+        
+        hit, image_name = self.match_cache.lookup(problem, fingerprint)
+        if hit:
+            return self.image_index.get(image_name)
+        
+        image_path = self.find_matching_image(problem)
+        self.match_cache.store(problem, fingerprint, image_path.name if image_path else None)
+        return image_path
+    
     def update_category_options(self, slide, category):
         """
         在PPT幻灯片中根据分类更新选项打勾
@@ -240,13 +314,15 @@ class GembaPPTGenerator:
         except Exception as e:
             logger.error(f"填充占位符时发生错误: {e}")
     
-    def add_image_to_slide(self, slide, image_path):
+    def add_image_to_slide(self, slide, image_path, placer=None, row_label=None):
         """
         向幻灯片添加图片
         
         Args:
             slide: PPT幻灯片对象
             image_path (Path): 图片路径
+            placer (PicturePlacer): 本次生成共用的图片插入器，为 None 时插入原图
+            row_label: 共用照片报告中标识这一行的标签
         """
         if not image_path or not image_path.exists():
             return
@@ -259,13 +335,9 @@ class GembaPPTGenerator:
                     slide.shapes._spTree.remove(shape._element)
                     break
             
-            # 添加新图片
-            left = Inches(6)  # 图片位置
-            top = Inches(2)
-            width = Inches(3)
-            height = Inches(2.5)
-            
-            slide.shapes.add_picture(str(image_path), left, top, width, height)
+            # 添加新图片，按实际宽高比放入图片区域
+            placer = placer or PicturePlacer()
+            placer.add(slide, image_path, PICTURE_LEFT, PICTURE_TOP, PICTURE_BOX, row_label)
             logger.info(f"图片已添加到幻灯片: {image_path.name}")
             
         except Exception as e:
@@ -280,6 +352,10 @@ class GembaPPTGenerator:
         """
         logger.info("开始生成PPT文件...")
         
+        # 本次生成的临时目录，结束时（包括出错）删除
+        scratch = default_scratch_space().job("gemba")
+        preparer = None
+        
         try:
             # 读取PPT模板
             presentation = Presentation(str(self.template_path))
@@ -289,7 +365,7 @@ class GembaPPTGenerator:
             self.update_first_slide_date(presentation)
             
             # 读取Excel数据
-            df = self.read_excel_data()
+            batch = self.read_excel_data()
             
             # 获取模板幻灯片（假设第二张幻灯片是模板）
             if len(presentation.slides) < 2:
@@ -297,10 +373,19 @@ class GembaPPTGenerator:
                 raise ValueError("PPT模板格式不正确")
                 
             template_slide = presentation.slides[1]
+            fingerprint = self.image_index.fingerprint()
+            
+            # 先确定每行的图片，在后台进程中预处理（使用缓存），与幻灯片构建同时进行
+            image_paths = [self.resolve_image(row, fingerprint) for row in batch]
+            preparer = ImagePreparer(PICTURE_BOX, cache=PreparedImageCache())
+            preparer.submit(path for path in image_paths if path)
+            deduper = PhotoDeduper() if self.dedupe_photos else None
+            # 图片部件内容暂存在临时目录中，保存时才读入，内存占用不随图片数量增长
+            placer = PicturePlacer(preparer, deduper, spool_dir=scratch.subdir("parts"), scratch=scratch)
             
             # 为每行数据创建新幻灯片
-            for index, row in df.iterrows():
-                logger.info(f"处理第 {index + 1}/{len(df)} 行数据...")
+            for index, (row, image_path) in enumerate(zip(batch, image_paths)):
+                logger.info(f"处理第 {index + 1}/{len(batch)} 行数据...")
                 
                 # 复制模板幻灯片
                 slide_layout = template_slide.slide_layout
@@ -326,18 +411,24 @@ class GembaPPTGenerator:
                 # 填充占位符
                 self.fill_placeholders(
                     new_slide,
-                    row.get("问题发现区域"),
-                    row.get("发现人"),
-                    row.get("问题收集")
+                    row.area,
+                    row.person,
+                    row.description
                 )
                 
                 # 更新分类选项
-                self.update_category_options(new_slide, row.get("问题分类"))
+                self.update_category_options(new_slide, row.category)
                 
                 # 添加匹配的图片
-                image_path = self.find_matching_image(row.get("问题收集"))
                 if image_path:
-                    self.add_image_to_slide(new_slide, image_path)
+                    self.add_image_to_slide(new_slide, image_path, placer, index + 1)
+            
+            preparer.close()
+            if preparer.cache_hits:
+                logger.info(f"预处理图片缓存命中: {preparer.cache_hits} 张")
+            if deduper:
+                for name, rows in deduper.shared_groups():
+                    logger.info(f"共用图片 {name}: 第 {'、'.join(map(str, rows))} 行")
             
             # 删除原始模板幻灯片
             if len(presentation.slides) > 2:
@@ -356,6 +447,12 @@ class GembaPPTGenerator:
         except Exception as e:
             logger.error(f"生成PPT时发生错误: {e}")
             raise
+        
+        finally:
+            # 出错时同样关闭图片预处理进程池
+            if preparer is not None:
+                preparer.close()
+            scratch.cleanup()
 
 def main():
     """主函数"""
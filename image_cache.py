@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预处理图片缓存 - 按内容寻址保存缩小后的图片，重复使用的照片不必再次解码
+
+每条缓存是 DEFAULT_CACHE_DIR/prepared 下的一个文件，文件名就是缓存键
+（由原图内容哈希和预处理参数计算得到，见 image_prep.cache_key）。
+文件的读写可以在预处理进程中直接进行；大小和最近使用顺序记录在 SQLite 中，
+由主进程在总大小超过 max_bytes 时按最近最少使用顺序淘汰。
+淘汰前扫描缓存目录：预处理进程写入后没有被取用的文件（生成被取消或中断）
+也计入总大小，并最先被淘汰。
+"""
+
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from match_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# 预处理图片缓存的容量（字节）
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# 超过该时间（秒）的临时文件视为中断写入留下的，扫描时删除
+STALE_TEMP_SECONDS = 3600
+
+
+def entry_path(root, key):
+    """缓存键对应的文件路径"""
+    return Path(root) / key[:2] / key
+
+
+def read_entry(root, key):
+    """读取缓存文件，不存在时返回 None"""
+    try:
+        with open(entry_path(root, key), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_entry(root, key, data):
+    """写入缓存文件，先写临时文件再替换，多个进程同时写入也不会读到不完整的内容"""
+    path = entry_path(root, key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_name, path)
+    except OSError as e:
+        logger.warning(f"写入预处理图片缓存失败: {e}")
+
+
+class PreparedImageCache:
+    """按内容寻址的预处理图片缓存，超出容量时淘汰最久未使用的图片"""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        打开（或创建）缓存
+
+        Args:
+            cache_dir (Path): 缓存目录，默认为 DEFAULT_CACHE_DIR
+            max_bytes (int): 缓存图片的总大小上限（字节）
+        """
+        cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        self.root = cache_dir / "prepared"
+        self.max_bytes = max_bytes
+        self._conn = None
+
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(cache_dir / "prepared_cache.sqlite3"))
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " last_used INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+            )
+            self._conn.commit()
+        except (OSError, sqlite3.Error) as e:
+            # 缓存不可用时不影响生成，只是每次都重新预处理
+            logger.warning(f"预处理图片缓存不可用: {e}")
+            self._conn = None
+
+    @property
+    def enabled(self):
+        return self._conn is not None
+
+    def record(self, key, size):
+        """记录一次读取或写入（缓存文件由预处理进程直接读写，之后由主进程调用）"""
+        if not self.enabled:
+            return
+        try:
+            tick = self._conn.execute(
+                "SELECT COALESCE(MAX(last_used), 0) + 1 FROM entries").fetchone()[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+                (key, size, tick))
+        except sqlite3.Error as e:
+            logger.warning(f"更新预处理图片缓存记录失败: {e}")
+
+    def scan(self):
+        """
+        扫描缓存目录，删除中断写入留下的临时文件
+
+        Returns:
+            dict: {缓存键: 文件大小}
+        """
+        files = {}
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        try:
+            subdirs = [entry.path for entry in os.scandir(self.root) if entry.is_dir()]
+        except OSError:
+            return files
+        for subdir in subdirs:
+            try:
+                with os.scandir(subdir) as it:
+                    for entry in it:
+                        stat = entry.stat()
+                        if entry.name.endswith(".tmp"):
+                            if stat.st_mtime < stale_before:
+                                os.remove(entry.path)
+                        else:
+                            files[entry.name] = stat.st_size
+            except OSError:
+                continue
+        return files
+
+    def _sync(self):
+        """按目录中的实际文件更新记录：未记录的文件按最久未使用加入，文件已不存在的记录删除"""
+        files = self.scan()
+        recorded = {key for key, in self._conn.execute("SELECT key FROM entries")}
+        self._conn.executemany(
+            "INSERT INTO entries (key, size, last_used) VALUES (?, ?, 0)",
+            [(key, size) for key, size in files.items() if key not in recorded])
+        self._conn.executemany(
+            "DELETE FROM entries WHERE key = ?", [(key,) for key in recorded if key not in files])
+
+    def evict(self):
+        """淘汰最久未使用的图片，使缓存目录的总大小不超过 max_bytes，并提交记录"""
+        if not self.enabled:
+            return
+        try:
+            self._sync()
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            removed = []
+            if total > self.max_bytes:
+                for key, size in self._conn.execute(
+                        "SELECT key, size FROM entries ORDER BY last_used"):
+                    if total <= self.max_bytes:
+                        break
+                    removed.append(key)
+                    total -= size
+            for key in removed:
+                try:
+                    os.remove(entry_path(self.root, key))
+                except OSError:
+                    pass
+            self._conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in removed])
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"清理预处理图片缓存失败: {e}")
+
+    def close(self):
+        """淘汰超出容量的图片并关闭数据库连接"""
+        if self._conn is not None:
+            self.evict()
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享图片库清单 - 为包含大量子文件夹的图片共享目录维护持久化的文件清单
+
+清单保存在 SQLite 中。每次刷新只对每个目录做一次 stat：
+目录修改时间未变时直接沿用上次记录的文件和子目录，只有发生变化的目录才重新扫描，
+并按文件大小和修改时间更新其中的图片记录。刷新后通过 index() 得到与
+ImageIndex 相同的查找接口（find / find_scored / match_* 等）。
+
+建立索引（尤其是文件名自动机）比刷新清单慢得多，因此建好的索引与清单指纹一起
+保存为 pickle 文件；清单没有变化时直接读取，同一进程内再次打开时直接复用。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from image_matcher import MATCHER_VERSION, ImageIndex
+from match_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# 共享图片库中需要收录的图片扩展名（不区分大小写）
+CATALOG_SUFFIXES = (".jpeg", ".jpg")
+
+# 本进程中已经建立的索引：{清单数据库路径: (清单指纹, ImageIndex)}
+_loaded_indexes = {}
+
+
+class ImageCatalog:
+    """增量刷新的共享图片库清单"""
+
+    def __init__(self, root, cache_dir=None, suffixes=CATALOG_SUFFIXES):
+        """
+        打开（或创建）图片库清单
+
+        Args:
+            root (Path): 图片库根目录
+            cache_dir (Path): 清单数据库所在目录，默认为 DEFAULT_CACHE_DIR
+            suffixes (tuple): 需要收录的图片扩展名
+        """
+        self.root = Path(root)
+        self.suffixes = tuple(suffix.lower() for suffix in suffixes)
+
+        cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        root_key = hashlib.sha1(str(self.root.resolve()).encode("utf-8")).hexdigest()[:16]
+        self.db_path = cache_dir / f"image_catalog_{root_key}.sqlite3"
+        self.index_path = cache_dir / f"image_catalog_{root_key}.index.pkl"
+
+        self._conn = sqlite3.connect(str(self.db_path))
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS dirs ("
+            " path TEXT PRIMARY KEY,"
+            " mtime_ns INTEGER NOT NULL,"
+            " subdirs TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS files ("
+            " dir TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " PRIMARY KEY (dir, name));"
+        )
+
+    def refresh(self):
+        """
+        增量刷新清单，只重新扫描修改时间发生变化的目录
+
+        注意：就地覆盖文件内容不会改变目录修改时间，这类变化不会被发现。
+
+        Returns:
+            int: 重新扫描的目录数量
+        """
+        stored = {
+            path: (mtime_ns, json.loads(subdirs))
+            for path, mtime_ns, subdirs in self._conn.execute("SELECT path, mtime_ns, subdirs FROM dirs")
+        }
+
+        seen = set()
+        rescanned = 0
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                mtime_ns = os.stat(self.root / rel_dir).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(rel_dir)
+
+            # 目录本身没有变化时，沿用记录的文件清单，只继续检查子目录
+            if rel_dir in stored and stored[rel_dir][0] == mtime_ns:
+                stack.extend(stored[rel_dir][1])
+                continue
+
+            subdirs = self._rescan_dir(rel_dir, mtime_ns)
+            stack.extend(subdirs)
+            rescanned += 1
+
+        # 删除已经不存在的目录
+        for rel_dir in set(stored) - seen:
+            self._conn.execute("DELETE FROM dirs WHERE path = ?", (rel_dir,))
+            self._conn.execute("DELETE FROM files WHERE dir = ?", (rel_dir,))
+
+        self._conn.commit()
+        logger.info(f"图片库刷新完成: 重新扫描 {rescanned} 个目录，共 {len(seen)} 个目录")
+        return rescanned
+
+    def _rescan_dir(self, rel_dir, mtime_ns):
+        """重新扫描单个目录，更新其中的图片记录，返回子目录列表"""
+        known = {
+            name: (size, file_mtime)
+            for name, size, file_mtime in self._conn.execute(
+                "SELECT name, size, mtime_ns FROM files WHERE dir = ?", (rel_dir,))
+        }
+
+        subdirs = []
+        current = {}
+        try:
+            with os.scandir(self.root / rel_dir) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(f"{rel_dir}/{entry.name}" if rel_dir else entry.name)
+                    elif os.path.splitext(entry.name)[1].lower() in self.suffixes and entry.is_file():
+                        stat = entry.stat()
+                        current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            logger.warning(f"扫描图片目录失败: {rel_dir or '.'}: {e}")
+
+        removed = [(rel_dir, name) for name in known if name not in current]
+        changed = [(rel_dir, name, size, file_mtime)
+                   for name, (size, file_mtime) in current.items() if known.get(name) != (size, file_mtime)]
+        self._conn.executemany("DELETE FROM files WHERE dir = ? AND name = ?", removed)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO files (dir, name, size, mtime_ns) VALUES (?, ?, ?, ?)", changed)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO dirs (path, mtime_ns, subdirs) VALUES (?, ?, ?)",
+            (rel_dir, mtime_ns, json.dumps(subdirs, ensure_ascii=False)))
+        return subdirs
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def index(self):
+        """
+        用清单中的图片建立索引（不访问图片文件）
+
+        清单指纹与上次建立索引时相同时，复用本进程中的索引或读取保存的索引，不再重新建立。
+
+        Returns:
+            ImageIndex: 与单个文件夹索引相同的查找接口
+        """
+        rows = self._conn.execute("SELECT dir, name, size, mtime_ns FROM files ORDER BY dir, name").fetchall()
+        digest = hashlib.sha1(f"v{MATCHER_VERSION}\n".encode("utf-8"))
+        for rel_dir, name, size, mtime_ns in rows:
+            digest.update(f"{rel_dir}/{name}\0{size}\0{mtime_ns}\n".encode("utf-8"))
+        fingerprint = digest.hexdigest()
+
+        loaded = _loaded_indexes.get(self.db_path)
+        if loaded and loaded[0] == fingerprint:
+            return loaded[1]
+
+        index = self._load_index(fingerprint)
+        if index is None:
+            paths = [self.root / rel_dir / name for rel_dir, name, _, _ in rows]
+            stats = [(size, mtime_ns) for _, _, size, mtime_ns in rows]
+            index = ImageIndex.from_paths(paths, images_path=self.root, stats=stats)
+            self._store_index(fingerprint, index)
+        _loaded_indexes[self.db_path] = (fingerprint, index)
+        return index
+
+    def _load_index(self, fingerprint):
+        """读取保存的索引，指纹不一致或读取失败时返回 None"""
+        try:
+            with open(self.index_path, "rb") as f:
+                # 文件中先保存指纹，指纹不一致时不必读取后面的索引
+                if pickle.load(f) != fingerprint:
+                    return None
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"读取图片库索引失败: {e}")
+            return None
+
+    def _store_index(self, fingerprint, index):
+        """保存索引，写入失败时只记录警告"""
+        try:
+            fd, temp_name = tempfile.mkstemp(dir=self.index_path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(fingerprint, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_name, self.index_path)
+        except OSError as e:
+            logger.warning(f"保存图片库索引失败: {e}")
+
+    def close(self):
+        """关闭数据库连接"""
+        self._conn.close()
+
+
+def load_image_library(root, cache_dir=None):
+    """刷新共享图片库清单并返回图片索引"""
+    catalog = ImageCatalog(root, cache_dir)
+    try:
+        catalog.refresh()
+        return catalog.index()
+    finally:
+        catalog.close()
@@ -0,0 +1,816 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片匹配索引 - 一次扫描图片文件夹，为每行问题描述快速查找匹配图片
+
+匹配优先级与原 find_matching_image 保持一致：
+1. 精确匹配：问题描述包含在图片文件名中
+2. 反向匹配：图片文件名包含在问题描述中
+3. 清理特殊字符后双向匹配
+4. 关键词匹配
+
+反向匹配使用 Aho-Corasick 自动机，每条问题描述只扫描一次；
+反向、清理后和关键词匹配命中多张图片时取最长的匹配，结果与目录顺序无关。
+
+四种子串匹配都失败时，用位并行（Myers）编辑距离和最长公共子序列
+计算模糊相似度，返回得分最高的候选图片。
+
+Excel 中有内嵌图片或附件列（附件文件名或 ID）时，先直接关联图片，其余行再做匹配。
+
+可选的拍摄时间匹配：文字匹配失败的行按巡检顺序（或时间列）与图片的 EXIF
+拍摄时间对齐，适用于 IMG_1234.jpeg 这类没有意义的文件名。
+
+match_all 对整批数据做一对一分配：用字符 n-gram 相似度矩阵一次算出
+所有行与图片的相似度，再求总相似度最大的分配，避免多行抢同一张图片。
+"""
+
+import hashlib
+import heapq
+import os
+import re
+from bisect import bisect_right
+from collections import Counter, deque
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+
+from image_probe import read_capture_time
+from inspection_records import InspectionBatch, as_batch
+
+# 默认只匹配 .jpeg 图片，不区分大小写（与原 images_path.glob("*.jpeg") 在 Windows 上一致）
+IMAGE_SUFFIXES = (".jpeg",)
+
+# 清理时需要去掉的字符
+CLEAN_CHARS = (" ", "，", "。", "_", "-")
+
+# 批量分配时的最低相似度（Dice 系数）
+MATCH_THRESHOLD = 0.5
+
+# 相似度使用的字符 n-gram 长度
+NGRAM_SIZES = (1, 2)
+
+# 模糊匹配的最低得分，以及保留的候选数量
+FUZZY_THRESHOLD = 0.5
+FUZZY_TOP_K = 3
+
+# 列出模糊候选时的最低得分，得分上限低于该值的图片不计算相似度
+FUZZY_CANDIDATE_SCORE = 0.3
+
+# 表单工具导出的附件列名（按顺序检测，使用第一个存在的列）
+ATTACHMENT_COLUMNS = ("附件", "附件名称", "附件文件名", "图片名称", "照片", "附件ID", "Attachment")
+
+# 一个单元格中有多个附件时使用的分隔符
+ATTACHMENT_SEPARATORS = re.compile(r"[,，;；\n|]+")
+
+# 记录时间列名（按顺序检测，使用第一个存在的列）
+TIMESTAMP_COLUMNS = ("拍摄时间", "发现时间", "提交时间", "填写时间", "创建时间")
+
+# 按时间列匹配时，记录时间与拍摄时间允许的最大差值
+CAPTURE_TIME_TOLERANCE = timedelta(minutes=30)
+
+# 匹配逻辑的版本号，匹配规则变化时递增，使旧的缓存结果失效
+MATCHER_VERSION = 2
+
+# 拼接文件名时使用的分隔符，问题描述中不会出现
+_SEPARATOR = "\x00"
+
+
+def normalize_text(text):
+    """去掉空格、中文逗号句号、下划线和连字符"""
+    for char in CLEAN_CHARS:
+        text = text.replace(char, "")
+    return text
+
+
+class AhoCorasick:
+    """多模式匹配自动机 - 一次扫描文本，找出其中包含的所有模式串"""
+
+    def __init__(self, patterns):
+        """
+        构建自动机
+
+        Args:
+            patterns (iterable): 模式串（空串会被忽略）
+        """
+        self.patterns = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [-1]       # 在该节点结束的模式串序号
+        self._output_link = [0]   # 沿失败链最近的、有输出的节点
+
+        for pattern in dict.fromkeys(patterns):
+            if pattern:
+                self._insert(pattern)
+        self._build_links()
+
+    def _insert(self, pattern):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(-1)
+                self._output_link.append(0)
+            node = next_node
+        self._output[node] = len(self.patterns)
+        self.patterns.append(pattern)
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                if fail == child:
+                    fail = 0
+                self._fail[child] = fail
+                if self._output[fail] >= 0:
+                    self._output_link[child] = fail
+                else:
+                    self._output_link[child] = self._output_link[fail]
+
+    def iter_matches(self, text):
+        """依次产出 (起始位置, 模式串)"""
+        node = 0
+        for end, char in enumerate(text, 1):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+
+            match = node if self._output[node] >= 0 else self._output_link[node]
+            while match:
+                pattern = self.patterns[self._output[match]]
+                yield end - len(pattern), pattern
+                match = self._output_link[match]
+
+    def findall(self, text):
+        """返回文本中包含的所有模式串"""
+        return {pattern for _, pattern in self.iter_matches(text)}
+
+
+class _StemTable:
+    """按顺序保存一组文件名，支持快速双向子串查找"""
+
+    def __init__(self, names):
+        self.names = names
+        self.joined = _SEPARATOR.join(names)
+
+        # 每个文件名在拼接字符串中的起始位置
+        self.offsets = []
+        position = 0
+        for name in names:
+            self.offsets.append(position)
+            position += len(name) + 1
+
+        # 文件名 -> 第一次出现的序号
+        self.first_index = {}
+        for i, name in enumerate(names):
+            if name:
+                self.first_index.setdefault(name, i)
+
+        self.matcher = AhoCorasick(self.first_index)
+
+    def first_containing(self, text):
+        """返回第一个包含 text 的文件名序号"""
+        if not text or _SEPARATOR in text:
+            return None
+        position = self.joined.find(text)
+        if position < 0:
+            return None
+        return bisect_right(self.offsets, position) - 1
+
+    def longest_contained_in(self, text):
+        """返回被 text 包含的最长文件名序号，长度相同时取靠前的"""
+        best = None
+        for name in self.matcher.findall(text):
+            index = self.first_index[name]
+            if best is None or (len(name), -index) > (len(self.names[best]), -best):
+                best = index
+        return best
+
+
+def _char_masks(text):
+    """每个字符在 text 中出现位置的位掩码"""
+    masks = {}
+    for i, char in enumerate(text):
+        masks[char] = masks.get(char, 0) | (1 << i)
+    return masks
+
+
+def edit_distance(a, b, masks=None):
+    """用 Myers 位并行算法计算 a 与 b 的编辑距离"""
+    m = len(a)
+    if not m:
+        return len(b)
+    if masks is None:
+        masks = _char_masks(a)
+
+    full = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    for char in b:
+        eq = masks.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+
+def lcs_length(a, b, masks=None):
+    """用位并行算法计算 a 与 b 的最长公共子序列长度"""
+    m = len(a)
+    if not m:
+        return 0
+    if masks is None:
+        masks = _char_masks(a)
+
+    full = (1 << m) - 1
+    v = full
+    for char in b:
+        u = v & masks.get(char, 0)
+        v = ((v + u) | (v - u)) & full
+    return m - bin(v).count("1")
+
+
+def fuzzy_score(a, b, masks=None):
+    """
+    模糊相似度：编辑距离比率与最长公共子序列比率中的较大者
+
+    编辑距离能容忍个别字符的差异，最长公共子序列能容忍词序调换
+    （如 "漏雨电镀门口" 与 "电镀门口漏雨"）。
+
+    Returns:
+        float: 0 到 1 之间的得分
+    """
+    if not a or not b:
+        return 0.0
+    if masks is None:
+        masks = _char_masks(a)
+    distance_ratio = 1 - edit_distance(a, b, masks) / max(len(a), len(b))
+    lcs_ratio = 2 * lcs_length(a, b, masks) / (len(a) + len(b))
+    return max(distance_ratio, lcs_ratio)
+
+
+def _stem(image):
+    """图片文件名（不含扩展名），图片可以是路径字符串、Path 或图片对象"""
+    return image.stem if hasattr(image, "stem") else Path(image).stem
+
+
+class ImageIndex:
+    """图片文件夹索引 - 构建时只扫描一次目录"""
+
+    def __init__(self, images_path, suffixes=IMAGE_SUFFIXES):
+        """
+        扫描图片文件夹并预计算清理后的文件名
+
+        Args:
+            images_path (Path): 图片文件夹路径，为 None 时建立空索引
+            suffixes (tuple): 需要索引的图片扩展名（不区分大小写）
+        """
+        self.images_path = Path(images_path) if images_path else None
+        self.suffixes = tuple(suffix.lower() for suffix in suffixes)
+
+        names = []
+        if self.images_path and self.images_path.is_dir():
+            with os.scandir(self.images_path) as it:
+                for entry in it:
+                    if os.path.splitext(entry.name)[1].lower() in self.suffixes and entry.is_file():
+                        names.append(entry.name)
+
+        # 按文件名排序，保证匹配结果与目录返回顺序无关
+        names.sort()
+        self._build([self.images_path / name for name in names])
+
+    @classmethod
+    def from_paths(cls, paths, images_path=None, stats=None):
+        """
+        用已知的图片路径列表建立索引，不扫描目录
+
+        Args:
+            paths (list): 图片路径或带 name/stem/read 的图片对象（如 ZipImage），按匹配优先顺序排列
+            images_path (Path): 图片根目录，指纹中使用相对于它的路径
+            stats (list): 可选的 (文件大小, 修改时间ns) 列表，提供时计算指纹不再访问文件；
+                图片对象必须提供（如压缩包中的大小和 CRC）
+
+        Returns:
+            ImageIndex: 图片索引
+        """
+        index = cls.__new__(cls)
+        index.images_path = Path(images_path) if images_path else None
+        index.suffixes = None
+        index._build([path if hasattr(path, "read") else Path(path) for path in paths], stats)
+        return index
+
+    def _build(self, paths, stats=None):
+        """预计算清理后的文件名和各种查找表"""
+        self.paths = paths
+        self.stems = [path.stem for path in paths]
+        self.clean_stems = [normalize_text(stem) for stem in self.stems]
+
+        self._by_name = {}
+        self._by_stem = {}
+        for path, stem in zip(self.paths, self.stems):
+            self._by_name.setdefault(path.name, path)
+            self._by_stem.setdefault(stem, path)
+        self._stats = stats
+        self._fingerprint = None
+
+        self._stems = _StemTable(self.stems)
+        self._clean_stems = _StemTable(self.clean_stems)
+        self._char_index = None
+        self._fuzzy_results = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def get(self, name):
+        """按文件名返回图片路径，不存在时返回 None"""
+        return self._by_name.get(name) if name else None
+
+    def lookup_attachment(self, attachment):
+        """
+        按附件列的值精确查找图片（文件名、不带扩展名的文件名或附件 ID）
+
+        Args:
+            attachment (str): 附件单元格内容，可包含多个附件或路径
+
+        Returns:
+            Path or None: 第一个能找到的附件图片
+        """
+        if not attachment:
+            return None
+        for key in ATTACHMENT_SEPARATORS.split(str(attachment)):
+            key = key.strip().replace("\\", "/").rsplit("/", 1)[-1]
+            image_path = self._by_name.get(key) or self._by_stem.get(key) \
+                or self._by_stem.get(os.path.splitext(key)[0])
+            if image_path:
+                return image_path
+        return None
+
+    def fingerprint(self):
+        """由文件名、大小和修改时间计算的文件夹指纹，内容变化后随之改变"""
+        if self._fingerprint is None:
+            digest = hashlib.sha1()
+            for i, path in enumerate(self.paths):
+                if self._stats:
+                    size, mtime_ns = self._stats[i]
+                else:
+                    stat = path.stat()
+                    size, mtime_ns = stat.st_size, stat.st_mtime_ns
+                name = path.relative_to(self.images_path).as_posix() if self.images_path else path.name
+                digest.update(f"{name}\0{size}\0{mtime_ns}\n".encode("utf-8"))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def match_exact(self, problem_description):
+        """方法1: 问题描述包含在图片文件名中"""
+        index = self._stems.first_containing(problem_description)
+        return None if index is None else self.paths[index]
+
+    def match_reverse(self, problem_description):
+        """方法2: 图片文件名包含在问题描述中（取最长的文件名）"""
+        index = self._stems.longest_contained_in(problem_description)
+        return None if index is None else self.paths[index]
+
+    def match_cleaned(self, problem_description):
+        """方法3: 清理特殊字符后双向匹配，整条描述被包含优先于部分包含"""
+        problem_clean = normalize_text(problem_description)
+        if not problem_clean:
+            return None
+        index = self._clean_stems.first_containing(problem_clean)
+        if index is None:
+            index = self._clean_stems.longest_contained_in(problem_clean)
+        return None if index is None else self.paths[index]
+
+    def match_keyword(self, problem_description):
+        """方法4: 按空格拆分关键词，取命中图片文件名的最长关键词"""
+        best = None
+        for keyword in problem_description.split():
+            if len(keyword) > 1:
+                index = self._stems.first_containing(keyword)
+                if index is not None and (best is None or (len(keyword), -index) > best):
+                    best = (len(keyword), -index)
+        return None if best is None else self.paths[-best[1]]
+
+    def stems_in(self, problem_description):
+        """返回问题描述中包含的所有图片（按文件名长度从长到短）"""
+        indexes = {self._stems.first_index[name]
+                   for name in self._stems.matcher.findall(problem_description)}
+        indexes = sorted(indexes, key=lambda i: (-len(self.stems[i]), i))
+        return [self.paths[i] for i in indexes]
+
+    def score(self, problem_description, image_path):
+        """问题描述与图片文件名的模糊相似度"""
+        return fuzzy_score(normalize_text(problem_description),
+                           normalize_text(_stem(image_path)))
+
+    def _build_char_index(self):
+        """字符 -> (包含该字符的图片序号数组, 该字符在各图片文件名中的出现次数)，以及文件名长度"""
+        postings = {}
+        for i, stem in enumerate(self.clean_stems):
+            for char, count in Counter(stem).items():
+                postings.setdefault(char, ([], []))
+                postings[char][0].append(i)
+                postings[char][1].append(count)
+        postings = {char: (np.array(ids, dtype=np.int32), np.array(counts, dtype=np.int32))
+                    for char, (ids, counts) in postings.items()}
+        lengths = np.array([len(stem) for stem in self.clean_stems], dtype=np.int32)
+        self._char_index = (postings, lengths)
+
+    def _score_bounds(self, query):
+        """
+        各图片模糊相似度的上限 2 * 相同字符数 / (m + n)
+
+        相同字符数（按出现次数计）不小于最长公共子序列长度，编辑距离不小于
+        max(m, n) - 相同字符数，因此两种比率都不会超过该上限；上限同时包含了长度差的限制。
+        """
+        if self._char_index is None:
+            self._build_char_index()
+        postings, lengths = self._char_index
+
+        ids, shared = [], []
+        for char, count in Counter(query).items():
+            if char in postings:
+                char_ids, char_counts = postings[char]
+                ids.append(char_ids)
+                shared.append(np.minimum(char_counts, count))
+        if not ids:
+            return np.zeros(len(self.paths))
+        shared = np.bincount(np.concatenate(ids), weights=np.concatenate(shared), minlength=len(self.paths))
+        return 2 * shared / np.maximum(lengths + len(query), 1)
+
+    def fuzzy_candidates(self, problem_description, k=FUZZY_TOP_K, min_score=FUZZY_CANDIDATE_SCORE):
+        """
+        按模糊相似度返回得分最高的 k 张候选图片
+
+        按得分上限从高到低计算相似度，上限低于 min_score 或已不可能进入前 k 名时停止，
+        结果与对所有图片打分相同。结果按问题描述保存，同一条描述再次查询
+        （如报告中列出低置信度行的候选）时不再重新计算。
+
+        Args:
+            problem_description (str): 问题描述
+            k (int): 候选数量
+            min_score (float): 候选的最低得分
+
+        Returns:
+            list: [(图片路径, 得分), ...]，按得分从高到低排列
+        """
+        query = normalize_text(problem_description or "")
+        if not query:
+            return []
+        key = (query, k, min_score)
+        if key not in self._fuzzy_results:
+            self._fuzzy_results[key] = self._rank_candidates(query, k, min_score)
+        return list(self._fuzzy_results[key])
+
+    def _rank_candidates(self, query, k, min_score):
+        bounds = self._score_bounds(query)
+        indexes = np.flatnonzero(bounds >= min_score)
+        # 上限相同时按序号排列，与按 (得分, -序号) 取最大值的结果一致
+        indexes = indexes[np.lexsort((indexes, -bounds[indexes]))]
+
+        masks = _char_masks(query)
+        best = []
+        for i in indexes.tolist():
+            if len(best) == k and bounds[i] < best[0][0]:
+                break
+            item = (fuzzy_score(query, self.clean_stems[i], masks), -i)
+            if item[0] < min_score:
+                continue
+            if len(best) < k:
+                heapq.heappush(best, item)
+            elif item > best[0]:
+                heapq.heapreplace(best, item)
+        return [(self.paths[-i], score) for score, i in sorted(best, reverse=True)]
+
+    def find_scored(self, problem_description, threshold=FUZZY_THRESHOLD):
+        """
+        按 精确 -> 反向 -> 清理后 -> 关键词 -> 模糊 的顺序查找匹配图片
+
+        Args:
+            problem_description (str): 问题描述
+            threshold (float): 模糊匹配的最低得分
+
+        Returns:
+            tuple: (图片路径或 None, 模糊相似度, 匹配方式)
+        """
+        if not problem_description or not self.paths:
+            return None, 0.0, None
+
+        for method, matcher in (("精确", self.match_exact), ("反向", self.match_reverse),
+                                ("清理", self.match_cleaned), ("关键词", self.match_keyword)):
+            image_path = matcher(problem_description)
+            if image_path:
+                return image_path, self.score(problem_description, image_path), method
+
+        # 计算全部 FUZZY_TOP_K 个候选并保存，报告中列出候选时直接使用
+        candidates = self.fuzzy_candidates(problem_description, min_score=min(threshold, FUZZY_CANDIDATE_SCORE))
+        if candidates and candidates[0][1] >= threshold:
+            return candidates[0][0], candidates[0][1], "模糊"
+        return None, 0.0, None
+
+    def find(self, problem_description):
+        """
+        按 精确 -> 反向 -> 清理后 -> 关键词 -> 模糊 的顺序查找匹配图片
+
+        Args:
+            problem_description (str): 问题描述
+
+        Returns:
+            Path or None: 匹配的图片路径
+        """
+        return self.find_scored(problem_description)[0]
+
+
+def char_ngrams(text, sizes=NGRAM_SIZES):
+    """返回清理后文本的字符 n-gram 集合"""
+    text = normalize_text(text)
+    return {text[i:i + n] for n in sizes for i in range(len(text) - n + 1)}
+
+
+def similarity_matrix(texts, names, sizes=NGRAM_SIZES):
+    """
+    计算两组文本两两之间的 n-gram Dice 相似度
+
+    Args:
+        texts (list): 问题描述列表
+        names (list): 图片文件名列表
+        sizes (tuple): n-gram 长度
+
+    Returns:
+        numpy.ndarray: 形状为 (len(texts), len(names)) 的相似度矩阵
+    """
+    text_grams = [char_ngrams(text, sizes) for text in texts]
+    name_grams = [char_ngrams(name, sizes) for name in names]
+
+    # 只有问题描述中出现过的 n-gram 才会影响交集
+    vocabulary = {}
+    for grams in text_grams:
+        for gram in grams:
+            vocabulary.setdefault(gram, len(vocabulary))
+
+    text_matrix = np.zeros((len(texts), len(vocabulary)), dtype=np.float32)
+    for i, grams in enumerate(text_grams):
+        text_matrix[i, [vocabulary[gram] for gram in grams]] = 1
+
+    name_matrix = np.zeros((len(names), len(vocabulary)), dtype=np.float32)
+    for j, grams in enumerate(name_grams):
+        columns = [vocabulary[gram] for gram in grams if gram in vocabulary]
+        name_matrix[j, columns] = 1
+
+    text_sizes = np.array([len(grams) for grams in text_grams], dtype=np.float32)
+    name_sizes = np.array([len(grams) for grams in name_grams], dtype=np.float32)
+
+    overlap = text_matrix @ name_matrix.T
+    total = text_sizes[:, None] + name_sizes[None, :]
+    return np.divide(2 * overlap, total, out=np.zeros_like(overlap), where=total > 0)
+
+
+def _linear_sum_assignment(cost):
+    """
+    匈牙利算法求最小代价分配（要求行数不大于列数）
+
+    Returns:
+        list: (行号, 列号) 列表，每行恰好分到一列
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=int)  # 列 j 当前分给的行（从 1 开始，0 表示空）
+    way = np.zeros(m + 1, dtype=int)
+
+    for i in range(1, n + 1):
+        owner[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = owner[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            improved = free & (reduced < minv[1:])
+            minv[1:][improved] = reduced[improved]
+            way[1:][improved] = j0
+
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+
+            u[owner[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+
+            j0 = j1
+            if owner[j0] == 0:
+                break
+
+        while j0:
+            j1 = way[j0]
+            owner[j0] = owner[j1]
+            j0 = j1
+
+    return [(owner[j] - 1, j - 1) for j in range(1, m + 1) if owner[j]]
+
+
+def match_all(rows, images, threshold=MATCH_THRESHOLD):
+    """
+    批量一对一分配图片：每张图片最多分给一行，总相似度最大
+
+    Args:
+        rows: InspectionBatch、数据行（含"问题收集"的字典）或问题描述字符串
+        images: ImageIndex 或图片路径列表
+        threshold (float): 低于该相似度的组合不会被分配
+
+    Returns:
+        tuple: (assignments, unmatched_rows, unmatched_images)
+            assignments: {行号: (图片路径, 相似度)}
+            unmatched_rows: 未分配图片的行号列表
+            unmatched_images: 未被使用的图片路径列表
+    """
+    if isinstance(rows, InspectionBatch):
+        texts = rows.descriptions
+    else:
+        texts = [row["问题收集"] if isinstance(row, dict) else row for row in rows]
+    paths = list(images)
+    names = [_stem(path) for path in paths]
+
+    assignments = {}
+    used_columns = set()
+    if texts and paths:
+        scores = similarity_matrix(texts, names)
+        scores[scores < threshold] = 0
+
+        # 只对至少有一个候选的行和图片求解，缩小分配问题规模
+        row_ids = np.flatnonzero(scores.any(axis=1))
+        col_ids = np.flatnonzero(scores.any(axis=0))
+        if len(row_ids):
+            cost = -scores[np.ix_(row_ids, col_ids)].astype(float)
+            transposed = len(row_ids) > len(col_ids)
+            pairs = _linear_sum_assignment(cost.T if transposed else cost)
+            for a, b in pairs:
+                r, c = (row_ids[b], col_ids[a]) if transposed else (row_ids[a], col_ids[b])
+                if scores[r, c] > 0:
+                    assignments[int(r)] = (paths[c], float(scores[r, c]))
+                    used_columns.add(int(c))
+
+    unmatched_rows = [i for i in range(len(texts)) if i not in assignments]
+    unmatched_images = [path for j, path in enumerate(paths) if j not in used_columns]
+    return assignments, unmatched_rows, unmatched_images
+
+
+def match_rows(rows, image_index, match_cache=None, embedded_images=None, use_capture_time=False):
+    """
+    为每行数据确定图片：先用 Excel 内嵌图片和附件列关联，再查匹配缓存，
+    其余行批量一对一分配，仍未分配的再逐行匹配
+
+    Args:
+        rows: InspectionBatch、数据行（含"问题收集"的字典）或问题描述字符串
+        image_index (ImageIndex): 图片索引
+        match_cache (MatchCache): 可选的匹配缓存
+        embedded_images (dict): 可选的 {Excel 行号: 内嵌图片}，按行的"行号"字段关联
+        use_capture_time (bool): 是否对文字匹配失败的行按拍摄时间分配图片
+
+    Returns:
+        list: 与 rows 一一对应的 (图片路径、内嵌图片或 None, 模糊相似度, 匹配方式)
+    """
+    batch = as_batch(rows)
+    texts = batch.descriptions
+    fingerprint = image_index.fingerprint() if match_cache else None
+
+    results = [(None, 0.0, None)] * len(texts)
+    pending = []
+    for i, text in enumerate(texts):
+        # 内嵌图片或附件列能直接关联到图片时不需要匹配
+        row_number = int(batch.row_numbers[i])
+        if embedded_images and row_number in embedded_images:
+            results[i] = (embedded_images[row_number], 1.0, "内嵌")
+            continue
+        image_path = image_index.lookup_attachment(batch.attachments[i])
+        if image_path:
+            results[i] = (image_path, 1.0, "附件")
+            continue
+        if match_cache:
+            hit, image_name = match_cache.lookup(text, fingerprint)
+            image_path = image_index.get(image_name)
+            if hit and image_path:
+                results[i] = (image_path, image_index.score(text, image_path), "缓存")
+                continue
+            if hit:
+                continue
+        pending.append(i)
+
+    if pending:
+        # 已被附件或缓存结果占用的图片不再参与一对一分配
+        claimed = {path for path, _, _ in results if path}
+        free_images = [path for path in image_index if path not in claimed]
+        assignments, _, _ = match_all([texts[i] for i in pending], free_images)
+
+        for k, i in enumerate(pending):
+            if k in assignments:
+                image_path = assignments[k][0]
+                results[i] = (image_path, image_index.score(texts[i], image_path), "批量分配")
+            else:
+                results[i] = image_index.find_scored(texts[i])
+            if match_cache:
+                image_path = results[i][0]
+                match_cache.store(texts[i], fingerprint, image_path.name if image_path else None)
+
+    if use_capture_time and any(image is None for image, _, _ in results):
+        match_by_capture_time(batch, results, image_index)
+
+    return results
+
+
+def match_by_capture_time(rows, results, image_index, tolerance=CAPTURE_TIME_TOLERANCE):
+    """
+    按照片拍摄时间为尚未匹配的行分配图片（原地更新 results）
+
+    数据行带有"时间"字段时，按时间就近一对一分配（差值不超过 tolerance）；
+    否则以已匹配行的图片拍摄时间为锚点，把相邻锚点之间未匹配的行与
+    拍摄时间落在该区间内的未使用图片按顺序对齐，两者数量相同时才分配。
+
+    Args:
+        rows: InspectionBatch、数据行（含"问题收集"的字典）或问题描述字符串
+        results (list): match_rows 返回的结果列表
+        image_index (ImageIndex): 图片索引
+        tolerance (timedelta): 按时间列匹配时允许的最大差值
+
+    Returns:
+        int: 新分配的行数
+    """
+    batch = as_batch(rows)
+    claimed = {image for image, _, _ in results if image}
+    capture_times = {}
+    for path in image_index:
+        if path not in claimed:
+            capture_time = read_capture_time(path)
+            if capture_time:
+                capture_times[path] = capture_time
+    if not capture_times:
+        return 0
+
+    assigned = 0
+
+    def assign(i, path):
+        results[i] = (path, image_index.score(batch.descriptions[i], path), "拍摄时间")
+        del capture_times[path]
+
+    # 1. 有时间列的行：按时间差从小到大一对一分配
+    pairs = []
+    for i, row_time in enumerate(batch.times):
+        if results[i][0] is None and row_time:
+            for path, capture_time in capture_times.items():
+                difference = abs(capture_time - row_time)
+                if difference <= tolerance:
+                    pairs.append((difference, i, path))
+    for _, i, path in sorted(pairs, key=lambda pair: pair[:2]):
+        if results[i][0] is None and path in capture_times:
+            assign(i, path)
+            assigned += 1
+
+    # 2. 其余行：以已匹配图片的拍摄时间为锚点，分段按顺序对齐
+    indexed = set(image_index)
+    anchors = []
+    for i, (image, _, _) in enumerate(results):
+        if image in indexed:
+            capture_time = read_capture_time(image)
+            if capture_time:
+                anchors.append((i, capture_time))
+
+    boundaries = [(-1, None)] + anchors + [(len(batch), None)]
+    for (start, low), (end, high) in zip(boundaries, boundaries[1:]):
+        if low and high and low > high:
+            continue
+        gap_rows = [i for i in range(start + 1, end) if results[i][0] is None]
+        gap_images = sorted(
+            ((capture_time, path) for path, capture_time in capture_times.items()
+             if (low is None or capture_time >= low) and (high is None or capture_time <= high)),
+            key=lambda item: (item[0], item[1].name)
+        )
+        if gap_rows and len(gap_rows) == len(gap_images):
+            for i, (_, path) in zip(gap_rows, gap_images):
+                assign(i, path)
+                assigned += 1
+
+    return assigned
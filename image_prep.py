@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片预处理 - 插入幻灯片前把现场照片缩小并重新压缩
+
+手机照片通常为 1200 万像素以上、3~8MB，而在幻灯片中只显示为几英寸大小。
+预处理把每张照片缩小到在图片区域内完整显示时、PICTURE_DPI 下所需的像素数：
+JPEG 使用 draft 模式按 DCT 比例直接解码为较小尺寸，不完整解码原图；
+按 EXIF 方向摆正后，以 JPEG_QUALITY 重新编码。
+预处理在进程池中进行，与幻灯片构建同时进行。
+
+提供 PreparedImageCache 时，结果按 (原图内容哈希, 图片区域, DPI, 质量) 缓存，
+再次遇到同一张照片时直接使用缓存的字节，不再解码。
+"""
+
+import hashlib
+import io
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+
+from image_cache import read_entry, write_entry
+from image_probe import TAG_ORIENTATION, TRANSPOSED_ORIENTATIONS
+from xlsx_images import picture_source
+
+logger = logging.getLogger(__name__)
+
+# 图片在幻灯片中的目标分辨率（每英寸像素数）
+PICTURE_DPI = 150
+
+# 重新编码 JPEG 的质量
+JPEG_QUALITY = 85
+
+# 预处理进程数，为 0 或 1 时在当前进程中依次处理
+PREP_WORKERS = min(4, os.cpu_count() or 1)
+
+# 预处理逻辑版本，修改预处理方式后递增，使旧的缓存不再命中
+PREP_VERSION = 2
+
+# 一次生成中同时解码图片可使用的内存上限（字节），按预处理进程数平分
+JOB_MEMORY_LIMIT = 1024 * 1024 * 1024
+
+
+class ImageTooLargeError(ValueError):
+    """图片解码所需内存超出上限"""
+
+
+def target_size(box, dpi=PICTURE_DPI):
+    """
+    计算图片区域在指定分辨率下的像素尺寸
+
+    Args:
+        box (tuple): 图片区域 (宽, 高)，单位英寸
+        dpi (int): 每英寸像素数
+
+    Returns:
+        tuple: (宽, 高)，单位像素
+    """
+    return math.ceil(box[0] * dpi), math.ceil(box[1] * dpi)
+
+
+def fit_in_box(size, left, top, box):
+    """
+    计算图片在图片区域内保持宽高比、居中显示的位置和大小
+
+    Args:
+        size (tuple): 图片显示尺寸 (宽, 高)，单位像素，未知时为 None
+        left (float): 图片区域左边位置，单位英寸
+        top (float): 图片区域上边位置，单位英寸
+        box (tuple): 图片区域 (宽, 高)，单位英寸
+
+    Returns:
+        tuple: (左, 上, 宽, 高)，单位英寸；尺寸未知时为整个图片区域
+    """
+    box_width, box_height = box
+    if not size:
+        return left, top, box_width, box_height
+
+    scale = min(box_width / size[0], box_height / size[1])
+    width = size[0] * scale
+    height = size[1] * scale
+    return left + (box_width - width) / 2, top + (box_height - height) / 2, width, height
+
+
+def prepare_image(data, box, dpi=PICTURE_DPI, quality=JPEG_QUALITY, max_decode_bytes=None):
+    """
+    把图片缩小到在图片区域内完整显示所需的尺寸，按 EXIF 方向摆正并重新编码
+
+    只缩小不放大；图片已经足够小且方向正确时原样返回。
+
+    Args:
+        data (bytes): 原始图片字节
+        box (tuple): 图片区域 (宽, 高)，单位英寸
+        dpi (int): 每英寸像素数
+        quality (int): JPEG 质量
+        max_decode_bytes (int): 解码后像素数据的大小上限（字节），为 None 时不限制
+
+    Returns:
+        bytes: 处理后的图片字节
+
+    Raises:
+        ImageTooLargeError: 按 draft 缩放后解码仍超出 max_decode_bytes
+    """
+    target_width, target_height = target_size(box, dpi)
+
+    with Image.open(io.BytesIO(data)) as image:
+        orientation = image.getexif().get(TAG_ORIENTATION, 1)
+        width, height = image.size
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+
+        scale = min(target_width / width, target_height / height)
+        if scale >= 1 and orientation == 1:
+            return data
+
+        if scale < 1 and image.format == "JPEG":
+            # draft 按 1/2、1/4、1/8 缩放解码，得到不小于请求尺寸的图片
+            draft_size = (math.ceil(image.size[0] * scale), math.ceil(image.size[1] * scale))
+            image.draft("RGB", draft_size)
+
+        # 在解码前按（draft 后的）尺寸检查内存，PNG 等格式无法按比例解码
+        decode_bytes = image.size[0] * image.size[1] * len(image.getbands())
+        if max_decode_bytes is not None and decode_bytes > max_decode_bytes:
+            raise ImageTooLargeError(
+                f"图片 {image.size[0]}x{image.size[1]} 解码需要 {decode_bytes // (1024 * 1024)} MB，"
+                f"超过上限 {max_decode_bytes // (1024 * 1024)} MB")
+
+        image = ImageOps.exif_transpose(image)
+        if scale < 1:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+        output = io.BytesIO()
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            # 带透明通道的图片保留为 PNG
+            image.save(output, format="PNG")
+        else:
+            image.convert("RGB").save(output, format="JPEG", quality=quality)
+        return output.getvalue()
+
+
+def _read_source(image):
+    """读取图片来源（文件路径、内嵌图片或压缩包中的图片）的字节"""
+    if hasattr(image, "read"):
+        return image.read()
+    with open(image, "rb") as f:
+        return f.read()
+
+
+def cache_key(data, box, dpi=PICTURE_DPI, quality=JPEG_QUALITY):
+    """由原图内容和预处理参数计算缓存键"""
+    digest = hashlib.sha1(data).hexdigest()
+    return hashlib.sha1(
+        f"v{PREP_VERSION}:{digest}:{box[0]}x{box[1]}:{dpi}:{quality}".encode("ascii")).hexdigest()
+
+
+def prepare_source(image, box, dpi=PICTURE_DPI, quality=JPEG_QUALITY, cache_root=None, max_decode_bytes=None):
+    """
+    读取并预处理一张图片，在预处理进程中执行
+
+    Args:
+        image: 图片路径或 EmbeddedImage
+        box (tuple): 图片区域 (宽, 高)，单位英寸
+        dpi (int): 每英寸像素数
+        quality (int): JPEG 质量
+        cache_root (Path): 预处理图片缓存目录，为 None 时不使用缓存
+        max_decode_bytes (int): 解码后像素数据的大小上限（字节）
+
+    Returns:
+        tuple: (缓存键, 处理后的图片字节, 是否命中缓存)
+    """
+    data = _read_source(image)
+    key = cache_key(data, box, dpi, quality)
+    if cache_root is not None:
+        cached = read_entry(cache_root, key)
+        if cached is not None:
+            return key, cached, True
+
+    prepared = prepare_image(data, box, dpi, quality, max_decode_bytes)
+    if cache_root is not None:
+        write_entry(cache_root, key, prepared)
+    return key, prepared, False
+
+
+def source_key(image):
+    """图片来源的唯一标识：文件路径，或内嵌图片、压缩包中图片自身提供的 key"""
+    if hasattr(image, "key"):
+        return image.key
+    return str(image)
+
+
+class ImagePreparer:
+    """在进程池中预处理一批图片，按需取出结果"""
+
+    def __init__(self, box, dpi=PICTURE_DPI, quality=JPEG_QUALITY, workers=PREP_WORKERS, cache=None,
+                 memory_limit=JOB_MEMORY_LIMIT):
+        """
+        Args:
+            box (tuple): 图片区域 (宽, 高)，单位英寸
+            dpi (int): 每英寸像素数
+            quality (int): JPEG 质量
+            workers (int): 预处理进程数
+            cache (PreparedImageCache): 预处理图片缓存，为 None 时不使用缓存
+            memory_limit (int): 同时解码图片可使用的内存上限（字节）
+        """
+        self.box = box
+        self.dpi = dpi
+        self.quality = quality
+        # 每个进程同时只解码一张图片，平分内存上限
+        self.max_decode_bytes = memory_limit // max(1, workers)
+        self.cache = cache
+        self.cache_hits = 0
+        self._cache_root = cache.root if cache is not None and cache.enabled else None
+        self._futures = {}
+        self._executor = None
+
+        if workers > 1:
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=workers)
+            except (OSError, NotImplementedError, ValueError) as e:
+                # 无法创建进程池时在当前进程中处理
+                logger.warning(f"无法创建图片预处理进程池: {e}")
+
+    def submit(self, images):
+        """提交需要预处理的图片，重复的图片只处理一次"""
+        if self._executor is None:
+            return
+        for image in images:
+            key = source_key(image)
+            if key not in self._futures:
+                self._futures[key] = self._executor.submit(
+                    prepare_source, image, self.box, self.dpi, self.quality, self._cache_root,
+                    self.max_decode_bytes)
+
+    def picture(self, image):
+        """
+        返回 add_picture 可用的预处理后图片
+
+        预处理失败时退回原图；图片超出解码内存上限时不退回原图，直接报错。
+
+        Args:
+            image: 图片路径或 EmbeddedImage
+
+        Returns:
+            BytesIO or str: 图片内存流，预处理失败时为原图来源
+
+        Raises:
+            ImageTooLargeError: 图片解码所需内存超出上限
+        """
+        # 取出后不再保留结果，避免整批预处理后的图片都留在内存中
+        future = self._futures.pop(source_key(image), None)
+        try:
+            if future is not None:
+                key, data, hit = future.result()
+            else:
+                key, data, hit = prepare_source(image, self.box, self.dpi, self.quality, self._cache_root,
+                                                self.max_decode_bytes)
+        except ImageTooLargeError:
+            raise
+        except Exception as e:
+            logger.warning(f"图片预处理失败，使用原图: {image}: {e}")
+            return picture_source(image)
+
+        if self._cache_root is not None:
+            # 缓存文件已由预处理进程读写，这里只记录使用顺序
+            self.cache.record(key, len(data))
+            self.cache_hits += hit
+        return io.BytesIO(data)
+
+    def close(self):
+        """关闭进程池，取消尚未开始的预处理，并按容量清理缓存"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._futures.clear()
+        if self._cache_root is not None:
+            self.cache.evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片头信息读取 - 只解析文件头，不解码像素
+
+用于读取 JPEG APP1 段中 EXIF 的拍摄时间（DateTimeOriginal）和方向，
+以及 JPEG SOF 段、PNG IHDR 块中的图片尺寸。
+"""
+
+import struct
+from datetime import datetime
+
+# 读取文件头时最多读取的字节数（EXIF 段最大 64KB）
+HEADER_READ_LIMIT = 128 * 1024
+
+# EXIF 标签
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+
+# 需要交换宽高的 EXIF 方向值（旋转 90 度或 270 度）
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# 含有图片尺寸的 JPEG SOF 段标记（排除 DHT、JPG、DAC）
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# TIFF 数据类型对应的字节数
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+
+def _jpeg_segments(data):
+    """依次返回 JPEG 文件头中各段的 (标记, 段内容)，到图像数据开始为止"""
+    if data[:2] != b"\xff\xd8":
+        return
+
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return
+        marker = data[position + 1]
+        if marker == 0xFF:
+            # 填充字节
+            position += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            position += 2
+            continue
+        if marker in (0xDA, 0xD9):
+            # 图像数据开始，之后不再有头信息
+            return
+
+        length = struct.unpack(">H", data[position + 2:position + 4])[0]
+        yield marker, data[position + 4:position + 2 + length]
+        position += 2 + length
+
+
+def _jpeg_exif_block(data):
+    """在 JPEG 文件头中查找 APP1 Exif 段，返回其中的 TIFF 数据"""
+    for marker, segment in _jpeg_segments(data):
+        if marker == 0xE1 and segment.startswith(b"Exif\x00\x00"):
+            return segment[6:]
+    return None
+
+
+def _ifd_entries(tiff, offset, endian):
+    """读取一个 IFD，返回 {标签: (类型, 数量, 值或偏移所在的 4 字节)}"""
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    count = struct.unpack(endian + "H", tiff[offset:offset + 2])[0]
+    for i in range(count):
+        start = offset + 2 + i * 12
+        if start + 12 > len(tiff):
+            break
+        tag, value_type, value_count = struct.unpack(endian + "HHI", tiff[start:start + 8])
+        entries[tag] = (value_type, value_count, tiff[start + 8:start + 12])
+    return entries
+
+
+def _entry_bytes(tiff, entry, endian):
+    """返回 IFD 条目的原始值字节"""
+    value_type, value_count, raw = entry
+    size = _TYPE_SIZES.get(value_type, 1) * value_count
+    if size <= 4:
+        return raw[:size]
+    offset = struct.unpack(endian + "I", raw)[0]
+    return tiff[offset:offset + size]
+
+
+def _parse_datetime(value):
+    text = value.split(b"\x00", 1)[0].decode("ascii", "ignore").strip()
+    try:
+        return datetime.strptime(text, "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def read_exif(tiff):
+    """
+    解析 EXIF 中的 TIFF 数据
+
+    Returns:
+        tuple: (字节序, IFD0 条目, Exif IFD 条目)，格式不正确时返回 None
+    """
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        return None
+
+    ifd0 = _ifd_entries(tiff, struct.unpack(endian + "I", tiff[4:8])[0], endian)
+    exif_ifd = {}
+    if TAG_EXIF_IFD in ifd0:
+        pointer = struct.unpack(endian + "I", ifd0[TAG_EXIF_IFD][2])[0]
+        exif_ifd = _ifd_entries(tiff, pointer, endian)
+    return endian, ifd0, exif_ifd
+
+
+def read_header(image_path, limit=HEADER_READ_LIMIT):
+    """读取图片文件开头的字节，也可以传入内存流、bytes 或压缩包中的图片（ZipImage）"""
+    if isinstance(image_path, (bytes, bytearray, memoryview)):
+        return bytes(image_path[:limit])
+    if hasattr(image_path, "read_header"):
+        return image_path.read_header(limit)
+    if hasattr(image_path, "seek"):
+        position = image_path.tell()
+        header = image_path.read(limit)
+        image_path.seek(position)
+        return header
+    with open(image_path, "rb") as f:
+        return f.read(limit)
+
+
+def read_capture_time(image_path):
+    """
+    读取 JPEG 的拍摄时间（EXIF DateTimeOriginal，没有时退回 DateTime）
+
+    Args:
+        image_path (Path): 图片路径
+
+    Returns:
+        datetime or None: 拍摄时间
+    """
+    try:
+        tiff = _jpeg_exif_block(read_header(image_path))
+        parsed = read_exif(tiff) if tiff else None
+    except (OSError, struct.error):
+        return None
+    if not parsed:
+        return None
+
+    endian, ifd0, exif_ifd = parsed
+    for entries, tag in ((exif_ifd, TAG_DATETIME_ORIGINAL), (ifd0, TAG_DATETIME)):
+        if tag in entries:
+            value = _parse_datetime(_entry_bytes(tiff, entries[tag], endian))
+            if value:
+                return value
+    return None
+
+
+def _orientation(tiff):
+    parsed = read_exif(tiff)
+    if not parsed:
+        return 1
+    endian, ifd0, _ = parsed
+    entry = ifd0.get(TAG_ORIENTATION)
+    if entry is None or entry[0] != 3:
+        return 1
+    return struct.unpack(endian + "H", entry[2][:2])[0]
+
+
+def header_size(header):
+    """
+    从文件头中解析图片的显示尺寸
+
+    JPEG 取 SOF 段中的宽高，并按 EXIF 方向交换；PNG 取 IHDR 块中的宽高。
+
+    Args:
+        header (bytes): 图片文件开头的字节
+
+    Returns:
+        tuple or None: (宽, 高)，单位像素，无法识别时返回 None
+    """
+    try:
+        if header.startswith(_PNG_SIGNATURE):
+            if header[12:16] != b"IHDR":
+                return None
+            return struct.unpack(">II", header[16:24])
+
+        orientation = 1
+        for marker, segment in _jpeg_segments(header):
+            if marker == 0xE1 and segment.startswith(b"Exif\x00\x00"):
+                orientation = _orientation(segment[6:])
+            elif marker in _SOF_MARKERS:
+                height, width = struct.unpack(">HH", segment[1:5])
+                if not width or not height:
+                    return None
+                if orientation in TRANSPOSED_ORIENTATIONS:
+                    return height, width
+                return width, height
+    except struct.error:
+        return None
+    return None
+
+
+def probe_size(image_path):
+    """
+    读取图片的显示尺寸，只读取文件头
+
+    Args:
+        image_path: 图片路径、内存流或 bytes
+
+    Returns:
+        tuple or None: (宽, 高)，单位像素，无法识别时返回 None
+    """
+    try:
+        return header_size(read_header(image_path))
+    except OSError:
+        return None
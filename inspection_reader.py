@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+巡厂数据读取 - 逐行读取 Excel 中需要的列
+
+pd.read_excel 会读取工作表的所有列并整体放入 DataFrame，月度汇总导出的表格
+往往有几十列、上万行。这里以只读模式打开工作簿，只取需要的列（四个必需列和
+附件、时间等额外列），按行依次产生，不构建整个表格。
+
+读取后端可以替换：默认优先使用已安装的 python-calamine（Rust 实现，速度更快），
+否则使用 openpyxl 只读模式；也可以用 register_backend 注册其他后端。
+
+表单系统导出的 CSV 和 Parquet 文件按扩展名直接选择对应的后端，不经过 xlsx 解析：
+CSV 用 csv 模块逐行读取，Parquet 通过 pyarrow（可选依赖）内存映射后只读取需要的列。
+"""
+
+import codecs
+import csv
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# 必需列
+REQUIRED_COLUMNS = ("问题发现区域", "发现人", "问题收集", "问题分类")
+
+# 未指定后端时按此顺序选择第一个可用的后端
+BACKEND_PREFERENCE = ("calamine", "openpyxl")
+
+# 按扩展名直接选择后端的数据文件格式
+FILE_FORMATS = {".csv": "csv", ".parquet": "parquet"}
+
+# CSV 文件的候选编码（表单系统导出的文件可能带 BOM，也可能是 GBK）
+CSV_ENCODINGS = ("utf-8-sig", "gbk")
+
+# 判断 CSV 编码时读取的字节数
+CSV_SNIFF_SIZE = 64 * 1024
+
+# Parquet 每批读取的行数
+PARQUET_BATCH_SIZE = 8192
+
+
+class OpenpyxlSheet:
+    """openpyxl 只读模式读取的工作表"""
+
+    name = "openpyxl"
+
+    @staticmethod
+    def available():
+        return True
+
+    def __init__(self, source, sheet=None):
+        """
+        Args:
+            source: Excel 文件路径或内存流
+            sheet (str): 工作表名称，为 None 时读取第一个工作表
+        """
+        import openpyxl
+
+        self._workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+        worksheet = self._workbook[sheet] if sheet else self._workbook.worksheets[0]
+        self._worksheet = worksheet
+        header = next(worksheet.iter_rows(min_row=1, max_row=1, values_only=True), ())
+        self.columns = list(header)
+
+    def rows(self, indexes):
+        """按列序号（从 0 开始）逐行产生 (Excel 行号, 值元组)"""
+        if not indexes:
+            return
+        low, high = min(indexes), max(indexes)
+        # 只取需要的列所在的范围
+        for row_number, values in enumerate(
+                self._worksheet.iter_rows(min_row=2, min_col=low + 1, max_col=high + 1, values_only=True),
+                start=2):
+            yield row_number, tuple(
+                values[i - low] if i - low < len(values) else None for i in indexes)
+
+    def close(self):
+        self._workbook.close()
+
+
+class CalamineSheet:
+    """python-calamine 读取的工作表"""
+
+    name = "calamine"
+
+    @staticmethod
+    def available():
+        try:
+            import python_calamine  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def __init__(self, source, sheet=None):
+        from python_calamine import CalamineWorkbook
+
+        self._workbook = CalamineWorkbook.from_object(source)
+        worksheet = (self._workbook.get_sheet_by_name(sheet) if sheet
+                     else self._workbook.get_sheet_by_index(0))
+        # calamine 从第一个非空单元格开始返回
+        self._first_row = getattr(worksheet, "start", (0, 0))[0] + 1
+        self._rows = worksheet.iter_rows()
+        header = next(self._rows, [])
+        self.columns = [_empty_to_none(value) for value in header]
+
+    def rows(self, indexes):
+        for row_number, values in enumerate(self._rows, start=self._first_row + 1):
+            yield row_number, tuple(
+                _empty_to_none(values[i]) if i < len(values) else None for i in indexes)
+
+    def close(self):
+        close = getattr(self._workbook, "close", None)
+        if close is not None:
+            close()
+
+
+class CsvSheet:
+    """csv 模块逐行读取的 CSV 文件，sheet 参数无效"""
+
+    name = "csv"
+
+    @staticmethod
+    def available():
+        return True
+
+    def __init__(self, source, sheet=None):
+        if hasattr(source, "read"):
+            self._binary = source
+            self._owned = False
+        else:
+            self._binary = open(source, "rb")
+            self._owned = True
+        encoding = _detect_encoding(_read_head(self._binary))
+        self._text = io.TextIOWrapper(self._binary, encoding=encoding, newline="")
+        self._reader = csv.reader(self._text)
+        header = next(self._reader, [])
+        self.columns = [_empty_to_none(value) for value in header]
+
+    def rows(self, indexes):
+        # 行号与 Excel 一致：表头为第 1 行，数据从第 2 行开始
+        for row_number, values in enumerate(self._reader, start=2):
+            if not any(values):
+                continue
+            yield row_number, tuple(
+                _empty_to_none(values[i]) if i < len(values) else None for i in indexes)
+
+    def close(self):
+        # 调用方传入的内存流不随读取结束而关闭
+        self._text.detach()
+        if self._owned:
+            self._binary.close()
+
+
+class ParquetSheet:
+    """pyarrow 读取的 Parquet 文件（文件路径使用内存映射），sheet 参数无效"""
+
+    name = "parquet"
+
+    @staticmethod
+    def available():
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def __init__(self, source, sheet=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("读取 Parquet 文件需要安装 pyarrow: pip install pyarrow") from None
+
+        if hasattr(source, "getbuffer"):
+            self._file = pa.BufferReader(source.getbuffer())
+        elif hasattr(source, "read"):
+            self._file = pa.PythonFile(source, mode="r")
+        else:
+            self._file = pa.memory_map(os.fspath(source), "r")
+        self._parquet = pq.ParquetFile(self._file)
+        self.columns = list(self._parquet.schema_arrow.names)
+
+    def rows(self, indexes):
+        if not indexes:
+            return
+        names = [self.columns[i] for i in indexes]
+        row_number = 2
+        for batch in self._parquet.iter_batches(batch_size=PARQUET_BATCH_SIZE, columns=names):
+            columns = [batch.column(name).to_pylist() for name in names]
+            for values in zip(*columns):
+                yield row_number, tuple(_empty_to_none(value) for value in values)
+                row_number += 1
+
+    def close(self):
+        self._parquet.close()
+        self._file.close()
+
+
+def _read_head(stream):
+    position = stream.tell()
+    head = stream.read(CSV_SNIFF_SIZE)
+    stream.seek(position)
+    return head
+
+
+def _detect_encoding(head):
+    """按 CSV_ENCODINGS 的顺序返回第一个能解码文件开头的编码"""
+    for encoding in CSV_ENCODINGS:
+        try:
+            # 增量解码允许末尾截断的多字节字符
+            codecs.getincrementaldecoder(encoding)().decode(head, final=False)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    return CSV_ENCODINGS[0]
+
+
+def _empty_to_none(value):
+    # calamine 和 CSV 用空字符串表示空单元格
+    return None if value == "" else value
+
+
+BACKENDS = {
+    OpenpyxlSheet.name: OpenpyxlSheet,
+    CalamineSheet.name: CalamineSheet,
+    CsvSheet.name: CsvSheet,
+    ParquetSheet.name: ParquetSheet,
+}
+
+
+def register_backend(backend, preferred=False):
+    """
+    注册读取后端
+
+    后端是一个类：name 属性为后端名称，available() 判断是否可用，
+    构造参数为 (source, sheet)，提供 columns、rows(indexes) 和 close()。
+
+    Args:
+        backend: 后端类
+        preferred (bool): 是否优先于已有后端使用
+    """
+    global BACKEND_PREFERENCE
+    BACKENDS[backend.name] = backend
+    if preferred:
+        BACKEND_PREFERENCE = (backend.name,) + tuple(
+            name for name in BACKEND_PREFERENCE if name != backend.name)
+    elif backend.name not in BACKEND_PREFERENCE:
+        BACKEND_PREFERENCE = BACKEND_PREFERENCE + (backend.name,)
+
+
+def file_format(source):
+    """
+    按扩展名判断数据文件格式
+
+    Args:
+        source: 文件路径或带 name 属性的内存流
+
+    Returns:
+        str or None: FILE_FORMATS 中对应的后端名称，Excel 等其他文件返回 None
+    """
+    name = getattr(source, "name", source) if hasattr(source, "read") else source
+    if not isinstance(name, (str, os.PathLike)):
+        return None
+    return FILE_FORMATS.get(os.path.splitext(os.fspath(name))[1].lower())
+
+
+class InspectionSheet:
+    """巡厂数据工作表，只读取需要的列"""
+
+    def __init__(self, source, sheet=None, backend=None):
+        """
+        打开工作表并读取表头
+
+        Args:
+            source: Excel、CSV 或 Parquet 文件路径或内存流（内存流按 name 属性判断格式）
+            sheet (str): 工作表名称，为 None 时读取第一个工作表；CSV 和 Parquet 文件忽略
+            backend (str): 读取后端名称，为 None 时 CSV 和 Parquet 文件按扩展名选择，
+                其他文件按 BACKEND_PREFERENCE 选择
+        """
+        if backend is None:
+            backend = file_format(source)
+        if backend is None:
+            backend = next(name for name in BACKEND_PREFERENCE
+                           if name in BACKENDS and BACKENDS[name].available())
+        self.backend = backend
+        self._sheet = BACKENDS[backend](source, sheet)
+        self.columns = self._sheet.columns
+        self.missing_columns = [column for column in REQUIRED_COLUMNS if column not in self.columns]
+
+    def first_present(self, candidates):
+        """返回候选列名中第一个存在的列，都不存在时返回 None"""
+        return next((column for column in candidates if column in self.columns), None)
+
+    def rows(self, extra_columns=()):
+        """
+        逐行产生必需列和额外列的值
+
+        Args:
+            extra_columns (list): 需要一起读取的其他列
+
+        Yields:
+            dict: {列名: 单元格值, "行号": Excel 行号}，不存在的列和空单元格为 None
+        """
+        names = list(REQUIRED_COLUMNS) + [column for column in extra_columns if column]
+        present = [name for name in names if name in self.columns]
+        indexes = [self.columns.index(name) for name in present]
+        absent = [name for name in names if name not in self.columns]
+
+        for row_number, values in self._sheet.rows(indexes):
+            row = dict(zip(present, values))
+            for name in absent:
+                row[name] = None
+            row["行号"] = row_number
+            yield row
+
+    def close(self):
+        self._sheet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
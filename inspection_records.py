@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+巡厂数据行 - 按列保存的数据批次和轻量的行对象
+
+InspectionBatch 按列保存清理后的数据：问题描述、附件、时间各为一个列表，
+区域、发现人、分类做字典编码，每行只保存一个小整数编码，相同的文字只保存一份。
+遍历批次得到的 InspectionRecord 只记录批次和行序号（__slots__），
+字段在访问时从列中取出，不为每行复制一份以中文列名为键的字典。
+按区域或分类分组直接在编码列上计算。
+"""
+
+import numpy as np
+import pandas as pd
+
+# 数据行字段与 Excel 列名的对应关系
+FIELD_COLUMNS = {
+    "row_number": "行号",
+    "area": "问题发现区域",
+    "person": "发现人",
+    "description": "问题收集",
+    "category": "问题分类",
+    "attachment": "附件",
+    "captured": "时间",
+}
+
+# 做字典编码的字段
+ENCODED_FIELDS = ("area", "person", "category")
+
+
+def encode(values):
+    """
+    字典编码
+
+    Args:
+        values: 值序列（None 也作为一个取值）
+
+    Returns:
+        tuple: (编码数组, 取值列表)，编码使用能容纳取值个数的最小无符号整数类型
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+    dtype = np.min_scalar_type(max(len(uniques) - 1, 0))
+    return codes.astype(dtype), list(uniques)
+
+
+class InspectionRecord:
+    """批次中的一行数据"""
+
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    @property
+    def row_number(self):
+        """Excel 行号，没有时为 None"""
+        row_number = self.batch.row_numbers[self.index]
+        return None if row_number < 0 else int(row_number)
+
+    @property
+    def area(self):
+        return self.batch.area_values[self.batch.area_codes[self.index]]
+
+    @property
+    def person(self):
+        return self.batch.person_values[self.batch.person_codes[self.index]]
+
+    @property
+    def description(self):
+        return self.batch.descriptions[self.index]
+
+    @property
+    def category(self):
+        return self.batch.category_values[self.batch.category_codes[self.index]]
+
+    @property
+    def attachment(self):
+        return self.batch.attachments[self.index]
+
+    @property
+    def captured(self):
+        return self.batch.times[self.index]
+
+    def to_dict(self):
+        """转换为以 Excel 列名为键的字典，值为 None 的字段不包含在内"""
+        values = ((column, getattr(self, field)) for field, column in FIELD_COLUMNS.items())
+        return {column: value for column, value in values if value is not None}
+
+    def __repr__(self):
+        return f"InspectionRecord({self.to_dict()!r})"
+
+
+class InspectionBatch:
+    """按列保存的巡厂数据"""
+
+    def __init__(self, descriptions, areas, persons, categories, row_numbers=None, attachments=None, times=None):
+        """
+        Args:
+            descriptions (list): 问题描述
+            areas (list): 问题发现区域
+            persons (list): 发现人
+            categories (list): 问题分类
+            row_numbers (list): Excel 行号，为 None 时各行都没有行号
+            attachments (list): 附件文件名，没有附件的行为 None
+            times (list): 提交时间（datetime），没有时间的行为 None
+        """
+        count = len(descriptions)
+        self.descriptions = list(descriptions)
+        self.area_codes, self.area_values = encode(areas)
+        self.person_codes, self.person_values = encode(persons)
+        self.category_codes, self.category_values = encode(categories)
+        self.row_numbers = np.asarray(row_numbers if row_numbers is not None else [-1] * count, dtype=np.int32)
+        self.attachments = list(attachments) if attachments is not None else [None] * count
+        self.times = list(times) if times is not None else [None] * count
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        由以 Excel 列名为键的字典列表创建批次
+
+        Args:
+            rows (list): [{"问题发现区域": ..., "问题收集": ..., ...}, ...]，缺少的字段为 None
+
+        Returns:
+            InspectionBatch: 数据批次
+        """
+        columns = {field: [row.get(column) for row in rows] for field, column in FIELD_COLUMNS.items()}
+        row_numbers = [-1 if value is None else value for value in columns["row_number"]]
+        return cls(columns["description"], columns["area"], columns["person"], columns["category"],
+                   row_numbers, columns["attachment"], columns["captured"])
+
+    def __len__(self):
+        return len(self.descriptions)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return InspectionRecord(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield InspectionRecord(self, index)
+
+    def groups(self, field):
+        """
+        按编码字段分组
+
+        Args:
+            field (str): ENCODED_FIELDS 中的字段，如 "area" 或 "category"
+
+        Returns:
+            dict: {取值: 行序号数组}，按取值第一次出现的顺序排列
+        """
+        if field not in ENCODED_FIELDS:
+            raise ValueError(f"不能按字段 {field} 分组")
+        codes = getattr(self, f"{field}_codes")
+        values = getattr(self, f"{field}_values")
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(values))
+        return {value: indexes for value, indexes in zip(values, np.split(order, np.cumsum(counts)[:-1]))
+                if len(indexes)}
+
+
+def as_batch(rows):
+    """
+    转换为数据批次
+
+    Args:
+        rows: InspectionBatch、以 Excel 列名为键的字典列表或问题描述字符串列表
+
+    Returns:
+        InspectionBatch: 数据批次，rows 已经是批次时原样返回
+    """
+    if isinstance(rows, InspectionBatch):
+        return rows
+    return InspectionBatch.from_rows([row if isinstance(row, dict) else {"问题收集": row} for row in rows])
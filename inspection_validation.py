@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+巡厂数据清理和校验 - 按列一次处理整张表，并生成校验报告
+
+读取的原始行先放入 DataFrame，去空白、空单元格转为空文本、时间列解析、
+未知分类和重复记录检查都按列进行，不逐行调用 Python 函数。
+清理结果保存为按列的 InspectionBatch，有问题的行汇总在 ValidationReport 中，
+在生成幻灯片之前展示。
+"""
+
+import warnings
+
+import pandas as pd
+
+from inspection_reader import REQUIRED_COLUMNS, InspectionSheet
+from inspection_records import InspectionBatch
+
+# 缺少必需列时使用的值
+MISSING_COLUMN_VALUE = "未知"
+
+# 分类为空时使用的分类
+DEFAULT_CATEGORY = "Others"
+
+# 判断重复记录的列
+DUPLICATE_COLUMNS = ("问题发现区域", "问题收集")
+
+# 清理逻辑版本，修改清理或校验方式后递增，使缓存的结果不再命中
+CLEAN_VERSION = 4
+
+
+class ValidationReport:
+    """数据校验结果"""
+
+    def __init__(self):
+        self.backend = None
+        self.total_rows = 0
+        self.valid_rows = 0
+        self.missing_columns = []
+        self.attachment_column = None
+        self.time_column = None
+        self.missing_description = []
+        self.unknown_categories = []
+        self.duplicates = []
+        self.invalid_times = []
+
+    @property
+    def ok(self):
+        """是否没有任何需要提示的问题"""
+        return not (self.missing_columns or self.missing_description or self.unknown_categories
+                    or self.duplicates or self.invalid_times)
+
+    def issues(self):
+        """
+        逐行列出问题
+
+        Returns:
+            list: [{"行号": Excel 行号, "问题": 问题类型, "内容": 说明}, ...]，按行号排序
+        """
+        issues = [{"行号": row, "问题": "缺少问题描述", "内容": ""} for row in self.missing_description]
+        issues += [{"行号": row, "问题": "未知分类", "内容": value} for row, value in self.unknown_categories]
+        issues += [{"行号": row, "问题": "重复记录", "内容": f"与第 {first} 行相同"}
+                   for row, first in self.duplicates]
+        issues += [{"行号": row, "问题": "时间无法识别", "内容": value} for row, value in self.invalid_times]
+        return sorted(issues, key=lambda issue: issue["行号"])
+
+    def summary(self):
+        """一行文字的问题汇总"""
+        parts = []
+        if self.missing_columns:
+            parts.append(f"缺少列 {'、'.join(self.missing_columns)}")
+        for label, items in (("缺少问题描述", self.missing_description), ("未知分类", self.unknown_categories),
+                             ("重复记录", self.duplicates), ("时间无法识别", self.invalid_times)):
+            if items:
+                parts.append(f"{label} {len(items)} 行")
+        return "，".join(parts) if parts else "未发现问题"
+
+
+def _text_column(frame, column, default=""):
+    """去掉首尾空白，空单元格和空白文本替换为 default"""
+    values = frame[column]
+    text = values.where(values.notna(), "").astype(str).str.strip()
+    return text.mask(text == "", default)
+
+
+def _wall_clock(value):
+    """解析单个时间值，带时区时去掉时区、保留当地时间；无法识别时返回 NaT"""
+    parsed = pd.to_datetime(value, errors="coerce", format="mixed")
+    if pd.isna(parsed):
+        return pd.NaT
+    return parsed.tz_localize(None) if parsed.tzinfo is not None else parsed
+
+
+def _parse_times(raw_times):
+    """
+    解析时间列
+
+    EXIF 拍摄时间是相机上的当地时间，不带时区。带时区的值只去掉时区、保留各自的当地时间，
+    不换算为 UTC，否则与照片的拍摄时间相差整数个小时。
+
+    Args:
+        raw_times (Series): 时间列的原始值
+
+    Returns:
+        Series: 不带时区的 datetime64 列，无法识别的值为 NaT
+    """
+    try:
+        with warnings.catch_warnings():
+            # 各行时区不统一时 pandas 给出 FutureWarning（以后的版本直接报错）
+            warnings.simplefilter("error", FutureWarning)
+            parsed = pd.to_datetime(raw_times, errors="coerce", format="mixed")
+    except (FutureWarning, ValueError, TypeError):
+        parsed = None
+
+    if parsed is not None and isinstance(parsed.dtype, pd.DatetimeTZDtype):
+        return parsed.dt.tz_localize(None)
+    if parsed is not None and parsed.dtype.kind == "M":
+        return parsed
+    # 时区不统一时逐个解析
+    return pd.Series([_wall_clock(value) for value in raw_times], index=raw_times.index, dtype="datetime64[ns]")
+
+
+def clean_frame(frame, categories, attachment_column=None, time_column=None, missing_columns=()):
+    """
+    清理并校验原始数据
+
+    Args:
+        frame (DataFrame): 原始数据，包含必需列、"行号"以及可选的附件列和时间列
+        categories: 已知的问题分类（如 get_category_mapping() 的键）
+        attachment_column (str): 附件列名
+        time_column (str): 时间列名
+        missing_columns (list): 表格中不存在的必需列，这些列使用 MISSING_COLUMN_VALUE
+
+    Returns:
+        tuple: (InspectionBatch, ValidationReport)
+    """
+    report = ValidationReport()
+    report.missing_columns = list(missing_columns)
+    report.attachment_column = attachment_column
+    report.time_column = time_column
+    report.total_rows = len(frame)
+
+    clean = pd.DataFrame({"行号": frame["行号"].astype(int)})
+    for column in REQUIRED_COLUMNS:
+        if column in missing_columns:
+            clean[column] = MISSING_COLUMN_VALUE
+        else:
+            clean[column] = _text_column(frame, column, DEFAULT_CATEGORY if column == "问题分类" else "")
+
+    # 问题描述为空的行不生成幻灯片；整行为空的行直接忽略，其余的在报告中提示
+    has_description = clean["问题收集"] != ""
+    present = [column for column in REQUIRED_COLUMNS if column not in missing_columns]
+    has_content = frame[present].notna().any(axis=1) if present else has_description
+    report.missing_description = clean.loc[~has_description & has_content, "行号"].tolist()
+
+    keep = has_description.to_numpy()
+    clean = clean[keep]
+    frame = frame[keep]
+    report.valid_rows = len(clean)
+
+    unknown = ~clean["问题分类"].isin(list(categories))
+    report.unknown_categories = list(zip(clean.loc[unknown, "行号"].tolist(),
+                                         clean.loc[unknown, "问题分类"].tolist()))
+
+    duplicated = clean.duplicated(list(DUPLICATE_COLUMNS), keep="first")
+    first_rows = clean.groupby(list(DUPLICATE_COLUMNS), sort=False)["行号"].transform("first")
+    report.duplicates = list(zip(clean.loc[duplicated, "行号"].tolist(),
+                                 first_rows[duplicated].tolist()))
+
+    attachments = None
+    if attachment_column:
+        attachments = [attachment or None for attachment in _text_column(frame, attachment_column).tolist()]
+
+    times = None
+    if time_column:
+        raw_times = frame[time_column]
+        parsed = _parse_times(raw_times)
+        valid = parsed.notna().to_numpy()
+        invalid = raw_times.notna().to_numpy() & ~valid
+        report.invalid_times = list(zip(clean.loc[invalid, "行号"].tolist(),
+                                        raw_times[invalid].astype(str).tolist()))
+        times = [captured if ok else None for captured, ok in zip(parsed.array.to_pydatetime(), valid)]
+
+    batch = InspectionBatch(clean["问题收集"].tolist(), clean["问题发现区域"], clean["发现人"], clean["问题分类"],
+                            clean["行号"].to_numpy(), attachments, times)
+    return batch, report
+
+
+def load_inspection_rows(source, categories, attachment_columns=(), timestamp_columns=(),
+                         sheet=None, backend=None, cache=None):
+    """
+    读取、清理并校验巡厂数据
+
+    Args:
+        source: Excel、CSV 或 Parquet 文件路径或内存流
+        categories: 已知的问题分类
+        attachment_columns (list): 附件列的候选列名，使用第一个存在的列
+        timestamp_columns (list): 时间列的候选列名，使用第一个存在的列
+        sheet (str): 工作表名称，为 None 时读取第一个工作表
+        backend (str): 读取后端名称
+        cache (WorkbookCache): 巡厂数据缓存，命中时不再打开工作簿；为 None 时不使用缓存
+
+    Returns:
+        tuple: (InspectionBatch, ValidationReport)，命中缓存时报告的 backend 为 "缓存"
+    """
+    if cache is not None:
+        options = (CLEAN_VERSION, sheet, sorted(categories), list(attachment_columns), list(timestamp_columns))
+        key = cache.key(source, options)
+        cached = cache.load(key)
+        if cached is not None:
+            batch, report = cached
+            report.backend = "缓存"
+            return batch, report
+
+    with InspectionSheet(source, sheet, backend) as inspection_sheet:
+        attachment_column = inspection_sheet.first_present(attachment_columns)
+        time_column = inspection_sheet.first_present(timestamp_columns)
+        columns = list(REQUIRED_COLUMNS) + [column for column in (attachment_column, time_column) if column]
+        frame = pd.DataFrame.from_records(inspection_sheet.rows([attachment_column, time_column]),
+                                          columns=columns + ["行号"])
+        missing_columns = inspection_sheet.missing_columns
+        backend = inspection_sheet.backend
+
+    batch, report = clean_frame(frame, categories, attachment_column, time_column, missing_columns)
+    report.backend = backend
+    if cache is not None:
+        cache.store(key, batch, report)
+    return batch, report
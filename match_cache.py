@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片匹配缓存 - 重复生成同一批数据时跳过图片匹配
+
+缓存保存在 SQLite 中，键为 (匹配方式, 清理后的问题描述, 图片文件夹指纹)，
+值为匹配到的图片文件名（空字符串表示没有匹配的图片）。
+图片文件夹的内容变化或匹配逻辑版本（MATCHER_VERSION）升级后，旧记录不再命中，
+并按最近最少使用顺序淘汰。
+"""
+
+import logging
+import os
+import sqlite3
+from pathlib import Path
+
+from image_matcher import MATCHER_VERSION, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 缓存目录，可通过环境变量 GEMBA_CACHE_DIR 修改
+DEFAULT_CACHE_DIR = Path(os.environ.get("GEMBA_CACHE_DIR", Path.home() / ".cache" / "gemba_ppt"))
+
+# 最多保留的匹配记录数
+DEFAULT_MAX_ENTRIES = 20000
+
+
+class MatchCache:
+    """基于 SQLite 的图片匹配缓存，超出容量时淘汰最久未使用的记录"""
+
+    def __init__(self, cache_dir=None, max_entries=DEFAULT_MAX_ENTRIES, scope="default"):
+        """
+        打开（或创建）缓存数据库
+
+        Args:
+            cache_dir (Path): 缓存目录，默认为 DEFAULT_CACHE_DIR
+            max_entries (int): 最多保留的记录数
+            scope (str): 匹配方式名称，不同匹配逻辑的结果互不共用
+        """
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR)
+        self.max_entries = max_entries
+        self.scope = f"{scope}:v{MATCHER_VERSION}"
+        self._conn = None
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.cache_dir / "match_cache.sqlite3"))
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS matches ("
+                " scope TEXT NOT NULL,"
+                " description TEXT NOT NULL,"
+                " fingerprint TEXT NOT NULL,"
+                " image_name TEXT NOT NULL,"
+                " last_used INTEGER NOT NULL,"
+                " PRIMARY KEY (scope, description, fingerprint))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS matches_last_used ON matches (last_used)"
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            # 缓存不可用时不影响生成，只是每次都重新匹配
+            logger.warning(f"匹配缓存不可用: {e}")
+            self._conn = None
+
+    def _next_tick(self):
+        row = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) + 1 FROM matches").fetchone()
+        return row[0]
+
+    def lookup(self, description, fingerprint):
+        """
+        查找缓存的匹配结果
+
+        Returns:
+            tuple: (是否命中, 图片文件名或 None)
+        """
+        if self._conn is None or not description:
+            return False, None
+
+        key = (self.scope, normalize_text(str(description).strip()), fingerprint)
+        try:
+            row = self._conn.execute(
+                "SELECT image_name FROM matches"
+                " WHERE scope = ? AND description = ? AND fingerprint = ?", key
+            ).fetchone()
+            if row is None:
+                return False, None
+            self._conn.execute(
+                "UPDATE matches SET last_used = ?"
+                " WHERE scope = ? AND description = ? AND fingerprint = ?",
+                (self._next_tick(),) + key
+            )
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"读取匹配缓存失败: {e}")
+            return False, None
+
+        return True, row[0] or None
+
+    def store(self, description, fingerprint, image_name):
+        """保存匹配结果，image_name 为 None 表示没有匹配的图片"""
+        if self._conn is None or not description:
+            return
+
+        key = (self.scope, normalize_text(str(description).strip()), fingerprint)
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO matches"
+                " (scope, description, fingerprint, image_name, last_used)"
+                " VALUES (?, ?, ?, ?, ?)",
+                key + (image_name or "", self._next_tick())
+            )
+            self._evict()
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"写入匹配缓存失败: {e}")
+
+    def _evict(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM matches WHERE rowid IN"
+                " (SELECT rowid FROM matches ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+近似重复照片合并 - 同一位置连拍的几张照片在报告中只嵌入一份
+
+对每张插入的照片计算 64 位差异哈希（dHash）：把照片缩小为 9x8 的灰度缩略图，
+用 NumPy 一次比较每行相邻像素的亮度。与之前照片的汉明距离不超过
+DEDUPE_DISTANCE 时视为同一张照片，这些行共用之前那张照片的图片部件。
+"""
+
+import io
+import logging
+
+import numpy as np
+from PIL import Image
+
+from image_prep import source_key
+
+logger = logging.getLogger(__name__)
+
+# 两张照片视为近似重复的最大汉明距离（64 位哈希）
+DEDUPE_DISTANCE = 6
+
+# 哈希边长，得到 HASH_SIZE * HASH_SIZE 位的哈希
+HASH_SIZE = 8
+
+
+def dhash(data):
+    """
+    计算图片的差异哈希
+
+    Args:
+        data (bytes): 图片字节
+
+    Returns:
+        int: 64 位哈希值
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG 按最小的 DCT 比例解码，缩略图不需要完整分辨率
+        image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+        thumbnail = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distances(value, hashes):
+    """计算一个哈希与一组哈希之间的汉明距离"""
+    diff = np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.uint64(value))
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _picture_bytes(picture):
+    if hasattr(picture, "getvalue"):
+        return picture.getvalue()
+    with open(picture, "rb") as f:
+        return f.read()
+
+
+class PhotoDeduper:
+    """在一次生成中合并重复和近似重复的照片"""
+
+    def __init__(self, distance=DEDUPE_DISTANCE):
+        """
+        Args:
+            distance (int): 视为近似重复的最大汉明距离
+        """
+        self.distance = distance
+        self._by_source = {}
+        self._hashes = []
+        self._sources = []
+        self._rows = []
+
+    def resolve(self, image, picture, row_label):
+        """
+        返回这一行实际使用的照片，与之前的照片近似重复时返回之前那张
+
+        Args:
+            image: 匹配到的图片路径或 EmbeddedImage
+            picture: 预处理后的图片（内存流或文件路径）
+            row_label: 报告中标识这一行的标签（如页码）
+
+        Returns:
+            图片路径或 EmbeddedImage：image 本身，或与之近似重复的之前的照片
+        """
+        key = source_key(image)
+        group = self._by_source.get(key)
+        if group is None:
+            data = _picture_bytes(picture)
+            try:
+                value = dhash(data)
+            except Exception as e:
+                logger.warning(f"计算图片哈希失败，不参与合并: {image}: {e}")
+                value = None
+
+            if value is not None and self._hashes:
+                known = [i for i, h in enumerate(self._hashes) if h is not None]
+                if known:
+                    distances = hamming_distances(value, [self._hashes[i] for i in known])
+                    nearest = int(np.argmin(distances))
+                    if distances[nearest] <= self.distance:
+                        group = known[nearest]
+
+            if group is None:
+                group = len(self._hashes)
+                self._hashes.append(value)
+                self._sources.append(image)
+                self._rows.append([])
+            self._by_source[key] = group
+
+        self._rows[group].append(row_label)
+        return self._sources[group]
+
+    def add_row(self, image, row_label):
+        """记录又有一行使用了已经 resolve 过的图片"""
+        self._rows[self._by_source[source_key(image)]].append(row_label)
+
+    def shared_groups(self):
+        """
+        返回共用同一张照片的行
+
+        Returns:
+            list: [(照片名称, [行标签, ...]), ...]，只包含两行及以上共用的照片
+        """
+        return [(getattr(image, "name", str(image)), rows)
+                for image, rows in zip(self._sources, self._rows) if len(rows) > 1]
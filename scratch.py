@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+临时空间管理 - 每次生成使用独立的临时目录，限制大小并保证清理
+
+每次生成（一个 job）在 SCRATCH_DIR 下得到一个以进程号命名的目录，
+图片部件暂存文件、精简版文件包等都写在其中。写入前按单次生成和整个进程
+的容量上限检查；生成结束时（成功、失败或被中断）目录都会被删除，
+进程退出时删除仍未清理的目录。进程异常退出留下的目录在下次启动时清理。
+"""
+
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 临时目录，可通过环境变量 GEMBA_SCRATCH_DIR 修改
+SCRATCH_DIR = Path(os.environ.get("GEMBA_SCRATCH_DIR", Path(tempfile.gettempdir()) / "gemba_scratch"))
+
+# 内存文件系统上的临时目录（设置环境变量 GEMBA_SCRATCH_TMPFS=1 时使用）
+TMPFS_SCRATCH_DIR = Path("/dev/shm/gemba_scratch")
+SCRATCH_ON_TMPFS = os.environ.get("GEMBA_SCRATCH_TMPFS") == "1"
+
+# 单次生成可使用的临时空间（字节）
+JOB_QUOTA = 2 * 1024 * 1024 * 1024
+
+# 同一进程中所有生成合计可使用的临时空间（字节）
+GLOBAL_QUOTA = 8 * 1024 * 1024 * 1024
+
+
+class ScratchQuotaError(OSError):
+    """临时空间超出容量上限"""
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):.0f} MB"
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class ScratchJob:
+    """一次生成的临时目录，作为上下文管理器使用时退出即删除"""
+
+    def __init__(self, space, path, quota):
+        self.space = space
+        self.path = path
+        self.quota = quota
+        self.used = 0
+        self._closed = False
+
+    def reserve(self, size):
+        """
+        登记即将写入的字节数
+
+        Raises:
+            ScratchQuotaError: 超出单次生成或整个进程的容量上限
+        """
+        if self.used + size > self.quota:
+            raise ScratchQuotaError(
+                f"本次生成的临时文件超过上限 {_megabytes(self.quota)}，请减少图片数量或缩小图片")
+        self.space._reserve(size)
+        self.used += size
+
+    def track(self, path, reserved=0):
+        """
+        登记已经写入的文件（如保存的 PPT），返回文件路径
+
+        Args:
+            path (Path): 文件路径
+            reserved (int): 写入前已经用 reserve 预留的字节数；大于 0 时文件已经在上限内写入，
+                只按实际大小修正用量，不再检查上限
+        """
+        size = os.path.getsize(path)
+        if reserved:
+            self.space._adjust(size - reserved)
+            self.used += size - reserved
+        else:
+            self.reserve(size)
+        return path
+
+    def write(self, path, data):
+        """
+        在临时目录中写入文件
+
+        Args:
+            path: 文件路径，相对路径按临时目录解析
+            data (bytes): 文件内容
+
+        Returns:
+            Path: 文件路径
+        """
+        path = self.path / path
+        self.reserve(len(data))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def subdir(self, name):
+        """创建并返回临时目录中的子目录"""
+        path = self.path / name
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def cleanup(self):
+        """删除临时目录并释放容量，可以重复调用"""
+        if self._closed:
+            return
+        self._closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.space._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+
+class ScratchSpace:
+    """临时空间：创建每次生成的临时目录，统计整个进程的用量"""
+
+    def __init__(self, root=None, use_tmpfs=SCRATCH_ON_TMPFS, job_quota=JOB_QUOTA, global_quota=GLOBAL_QUOTA):
+        """
+        Args:
+            root (Path): 临时目录，默认为 SCRATCH_DIR
+            use_tmpfs (bool): 是否使用 /dev/shm 上的目录（不可用时退回 root）
+            job_quota (int): 单次生成的容量上限（字节）
+            global_quota (int): 所有生成合计的容量上限（字节）
+        """
+        root = Path(root or SCRATCH_DIR)
+        if use_tmpfs and os.access(TMPFS_SCRATCH_DIR.parent, os.W_OK):
+            root = TMPFS_SCRATCH_DIR
+        self.root = root
+        self.job_quota = job_quota
+        self.global_quota = global_quota
+        self.used = 0
+        self._jobs = set()
+        self._lock = threading.Lock()
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        removed = self.sweep_orphans()
+        if removed:
+            logger.info(f"已清理 {removed} 个遗留的临时目录")
+        atexit.register(self._cleanup_all)
+
+    def job(self, prefix="job"):
+        """
+        创建一次生成的临时目录
+
+        Args:
+            prefix (str): 目录名前缀
+
+        Returns:
+            ScratchJob: 临时目录
+        """
+        path = self.root / f"{prefix}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        path.mkdir()
+        job = ScratchJob(self, path, self.job_quota)
+        with self._lock:
+            self._jobs.add(job)
+        return job
+
+    def sweep_orphans(self):
+        """
+        删除创建它的进程已经退出的临时目录
+
+        Returns:
+            int: 删除的目录数
+        """
+        removed = 0
+        for path in self.root.iterdir():
+            try:
+                pid = int(path.name.rsplit("-", 2)[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and not _process_alive(pid):
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def _reserve(self, size):
+        with self._lock:
+            if self.used + size > self.global_quota:
+                raise ScratchQuotaError(
+                    f"临时空间已用 {_megabytes(self.used)}，超过上限 {_megabytes(self.global_quota)}，请稍后再试")
+            self.used += size
+
+    def _adjust(self, size):
+        with self._lock:
+            self.used += size
+
+    def _release(self, job):
+        with self._lock:
+            self.used -= job.used
+            self._jobs.discard(job)
+
+    def _cleanup_all(self):
+        for job in list(self._jobs):
+            job.cleanup()
+
+
+_default_space = None
+_default_lock = threading.Lock()
+
+
+def default_scratch_space():
+    """进程共用的临时空间，第一次调用时创建并清理遗留目录"""
+    global _default_space
+    with _default_lock:
+        if _default_space is None:
+            _default_space = ScratchSpace()
+        return _default_space
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+幻灯片图片插入 - 同一张图片在一次生成中只创建一次图片部件
+
+python-pptx 的 add_picture 每次都会重新读取图片、计算 SHA1，
+再在已有图片部件中逐个查找相同内容。这里按图片来源记录已经创建的
+图片部件和显示尺寸，同一张图片再次插入时只增加一条幻灯片关系，不再读取文件。
+
+提供 spool_dir 时，图片部件只保存磁盘文件的路径，保存 PPT 时才逐个读入并写入压缩包，
+内存占用不随图片数量增长。
+
+提供 link_dir 时（精简版 PPT），图片不嵌入 PPT，而是写入 link_dir 并以相对路径链接，
+PPT 需要保存在 link_dir 的上一级目录中，两者一起作为一个文件包分发。
+"""
+
+import io
+import os
+import zipfile
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.oxml.ns import qn
+from pptx.parts.image import Image, ImagePart
+from pptx.util import Inches
+
+from image_prep import fit_in_box, source_key
+from image_probe import probe_size
+from xlsx_images import picture_source
+
+# 精简版 PPT 文件包中存放链接图片的文件夹名
+LINKED_PHOTO_FOLDER = "图片"
+
+
+class FileImagePart(ImagePart):
+    """内容保存在磁盘文件中的图片部件，保存 PPT 时才读取"""
+
+    def __init__(self, partname, content_type, package, path, sha1, filename=None):
+        super().__init__(partname, content_type, package, None, filename)
+        self._path = path
+        self._sha1 = sha1
+
+    @property
+    def blob(self):
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    @property
+    def image(self):
+        return Image(self.blob, self.desc)
+
+    @property
+    def sha1(self):
+        return self._sha1
+
+    @property
+    def _dpi(self):
+        return self.image.dpi
+
+    @property
+    def _px_size(self):
+        return self.image.size
+
+
+class PicturePlacer:
+    """向幻灯片插入图片，按图片来源复用已创建的图片部件"""
+
+    def __init__(self, preparer=None, deduper=None, spool_dir=None, link_dir=None, scratch=None):
+        """
+        Args:
+            preparer (ImagePreparer): 图片预处理器，为 None 时插入原图
+            deduper (PhotoDeduper): 近似重复照片合并器，为 None 时不合并
+            spool_dir (Path): 图片部件内容的暂存目录，为 None 时图片保存在内存中；
+                目录需要保留到 PPT 保存完成
+            link_dir (Path): 链接图片的存放目录，提供时图片以相对路径链接而不嵌入
+            scratch (ScratchJob): 目录所在的临时空间，提供时写入的文件计入其容量
+        """
+        self.preparer = preparer
+        self.deduper = deduper
+        self.spool_dir = spool_dir
+        self.link_dir = Path(link_dir) if link_dir is not None else None
+        self.scratch = scratch
+        self.reused = 0
+        # 使用暂存目录时嵌入 PPT 的图片部件总大小（字节），用于估计保存后的文件大小
+        self.embedded_bytes = 0
+        self._parts = {}
+        self._parts_by_sha1 = {}
+        self._link_names = set()
+
+        for directory in (spool_dir, link_dir):
+            if directory is not None:
+                os.makedirs(directory, exist_ok=True)
+
+    def _write(self, path, data):
+        if self.scratch is not None:
+            self.scratch.reserve(len(data))
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def _new_link(self, image, picture):
+        """把图片写入链接目录，返回相对于 PPT 所在目录的链接地址"""
+        if isinstance(picture, str):
+            with open(picture, "rb") as f:
+                data = f.read()
+        else:
+            data = picture.getvalue()
+
+        # 文件名沿用原图名称，扩展名按实际格式，重名时加序号
+        stem = Path(getattr(image, "name", str(image))).stem
+        ext = Image.from_blob(data).ext
+        name = f"{stem}.{ext}"
+        number = 1
+        while name in self._link_names:
+            number += 1
+            name = f"{stem}_{number}.{ext}"
+        self._link_names.add(name)
+
+        self._write(self.link_dir / name, data)
+        return quote(f"{self.link_dir.name}/{name}")
+
+    def _new_part(self, slide, picture):
+        """创建图片部件，使用暂存目录时图片内容写入磁盘"""
+        if self.spool_dir is None:
+            image_part, _ = slide.part.get_or_add_image_part(picture)
+            return image_part
+
+        image = Image.from_file(picture)
+        image_part = self._parts_by_sha1.get(image.sha1)
+        if image_part is not None:
+            return image_part
+
+        if isinstance(picture, str):
+            # 未经预处理的原图直接引用原文件
+            path = picture
+        else:
+            path = os.path.join(self.spool_dir, f"{image.sha1}.{image.ext}")
+            self._write(path, image.blob)
+        self.embedded_bytes += len(image.blob)
+
+        package = slide.part.package
+        image_part = FileImagePart(
+            package.next_image_partname(image.ext), image.content_type, package,
+            path, image.sha1, image.filename)
+        self._parts_by_sha1[image.sha1] = image_part
+        return image_part
+
+    def _load(self, slide, image, row_label):
+        """第一次插入某张图片时创建图片部件，返回 (图片部件, 显示尺寸)"""
+        picture = self.preparer.picture(image) if self.preparer else picture_source(image)
+        if self.deduper:
+            representative = self.deduper.resolve(image, picture, row_label)
+            cached = self._parts.get(source_key(representative))
+            if cached is not None:
+                return cached
+
+        size = probe_size(picture)
+        if self.link_dir is not None:
+            return self._new_link(image, picture), size
+        return self._new_part(slide, picture), size
+
+    def add(self, slide, image, left, top, box, row_label=None):
+        """
+        在图片区域内按实际宽高比插入图片
+
+        Args:
+            slide: PPT幻灯片对象
+            image: 图片路径或 EmbeddedImage
+            left (float): 图片区域左边位置，单位英寸
+            top (float): 图片区域上边位置，单位英寸
+            box (tuple): 图片区域 (宽, 高)，单位英寸
+            row_label: 共用照片报告中标识这一行的标签
+
+        Returns:
+            Picture: 新插入的图片形状
+        """
+        key = source_key(image)
+        cached = self._parts.get(key)
+        if cached is None:
+            cached = self._parts[key] = self._load(slide, image, row_label)
+        else:
+            self.reused += 1
+            if self.deduper:
+                self.deduper.add_row(image, row_label)
+
+        target, size = cached
+        linked = isinstance(target, str)
+        if linked:
+            rId = slide.part.relate_to(target, RT.IMAGE, is_external=True)
+            desc = unquote(target.rsplit("/", 1)[-1])
+        else:
+            rId = slide.part.relate_to(target, RT.IMAGE)
+            desc = target.desc
+        x, y, width, height = fit_in_box(size, left, top, box)
+
+        # 直接添加 p:pic 元素：尺寸已经确定，不需要 python-pptx 再解析图片
+        shapes = slide.shapes
+        shape_id = shapes._next_shape_id
+        pic = shapes._grpSp.add_pic(shape_id, f"Picture {shape_id - 1}", desc, rId,
+                                    Inches(x), Inches(y), Inches(width), Inches(height))
+        if linked:
+            # 链接图片使用 r:link 而不是 r:embed
+            blip = pic.blipFill.blip
+            del blip.attrib[qn("r:embed")]
+            blip.set(qn("r:link"), rId)
+        shapes._recalculate_extents()
+        return shapes._shape_factory(pic)
+
+
+def pack_bundle(bundle_dir):
+    """
+    把精简版 PPT 文件包（PPT 和链接图片文件夹）打包为一个 ZIP
+
+    Args:
+        bundle_dir (Path): 文件包目录
+
+    Returns:
+        bytes: ZIP 文件内容
+    """
+    bundle_dir = Path(bundle_dir)
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as bundle:
+        for path in sorted(bundle_dir.rglob("*")):
+            if path.is_file():
+                # PPT 和图片本身已经压缩，直接存储
+                bundle.write(path, path.relative_to(bundle_dir).as_posix(), zipfile.ZIP_STORED)
+    return output.getvalue()
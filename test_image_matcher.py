@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片匹配测试 - 在小规模随机输入上与暴力算法的结果对照，以及图片文件夹索引
+"""
+
+import itertools
+import random
+
+import numpy as np
+
+from image_matcher import AhoCorasick, ImageIndex, _linear_sum_assignment, edit_distance, lcs_length
+
+# 随机字符串使用的小字母表，保证模式串之间有足够多的重叠
+ALPHABET = "门口标识漏雨"
+
+# 每个测试生成的随机用例数
+CASES = 300
+
+
+def random_text(rng, max_length):
+    """生成长度为 0 到 max_length 的随机字符串"""
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, max_length)))
+
+
+def naive_edit_distance(a, b):
+    """动态规划计算编辑距离"""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def naive_lcs_length(a, b):
+    """动态规划计算最长公共子序列长度"""
+    previous = [0] * (len(b) + 1)
+    for char_a in a:
+        current = [0]
+        for j, char_b in enumerate(b, 1):
+            current.append(previous[j - 1] + 1 if char_a == char_b else max(previous[j], current[j - 1]))
+        previous = current
+    return previous[-1]
+
+
+def test_aho_corasick_matches_substring_search():
+    """自动机找到的 (位置, 模式串) 与逐个模式串查找子串的结果相同"""
+    rng = random.Random(3)
+    for _ in range(CASES):
+        patterns = [random_text(rng, 4) for _ in range(rng.randint(0, 8))]
+        text = random_text(rng, 20)
+
+        expected = {
+            (start, pattern)
+            for pattern in set(patterns) if pattern
+            for start in range(len(text) - len(pattern) + 1)
+            if text.startswith(pattern, start)
+        }
+        matcher = AhoCorasick(patterns)
+        assert set(matcher.iter_matches(text)) == expected, (patterns, text)
+        assert matcher.findall(text) == {pattern for _, pattern in expected}
+
+
+def test_edit_distance_matches_dynamic_programming():
+    """位并行编辑距离与动态规划结果相同"""
+    rng = random.Random(5)
+    for _ in range(CASES):
+        a, b = random_text(rng, 12), random_text(rng, 12)
+        assert edit_distance(a, b) == naive_edit_distance(a, b), (a, b)
+
+
+def test_lcs_length_matches_dynamic_programming():
+    """位并行最长公共子序列长度与动态规划结果相同"""
+    rng = random.Random(7)
+    for _ in range(CASES):
+        a, b = random_text(rng, 12), random_text(rng, 12)
+        assert lcs_length(a, b) == naive_lcs_length(a, b), (a, b)
+
+
+def test_linear_sum_assignment_matches_permutations():
+    """匈牙利算法的总代价等于枚举所有分配得到的最小代价"""
+    rng = np.random.default_rng(11)
+    for _ in range(CASES):
+        n = int(rng.integers(1, 5))
+        m = int(rng.integers(n, 6))
+        # 整数代价使并列的最优解很常见，同时避免浮点误差
+        cost = rng.integers(0, 6, size=(n, m)).astype(float)
+
+        pairs = _linear_sum_assignment(cost)
+        rows = [row for row, _ in pairs]
+        columns = [column for _, column in pairs]
+        assert sorted(rows) == list(range(n))
+        assert len(set(columns)) == n
+
+        best = min(sum(cost[row, column] for row, column in enumerate(assignment))
+                   for assignment in itertools.permutations(range(m), n))
+        assert cost[rows, columns].sum() == best, cost
+
+
+def test_index_suffixes_ignore_case(tmp_path):
+    """扩展名大小写不同的图片都被索引"""
+    for name in ("门口漏雨.JPEG", "地面油污.jpeg", "灭火器.Jpeg", "说明.txt"):
+        (tmp_path / name).write_bytes(b"data")
+
+    index = ImageIndex(tmp_path)
+    assert sorted(path.name for path in index) == ["地面油污.jpeg", "灭火器.Jpeg", "门口漏雨.JPEG"]
+    assert index.find("门口漏雨") == tmp_path / "门口漏雨.JPEG"
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+巡厂数据清理测试 - 时间列中带时区和时区不统一的值
+"""
+
+from datetime import datetime
+
+import pandas as pd
+
+from image_matcher import CAPTURE_TIME_TOLERANCE
+from inspection_validation import clean_frame
+
+CATEGORIES = ("5S", "Safety")
+
+
+def make_frame(times):
+    """构造包含时间列的原始数据"""
+    count = len(times)
+    return pd.DataFrame({
+        "问题发现区域": ["装配"] * count,
+        "发现人": ["谢佳"] * count,
+        "问题收集": [f"问题{i}" for i in range(count)],
+        "问题分类": ["5S"] * count,
+        "提交时间": pd.Series(times, dtype=object),
+        "行号": list(range(2, count + 2)),
+    })
+
+
+def test_same_offset_times_keep_wall_clock():
+    """所有值时区相同时去掉时区，保留当地时间"""
+    batch, report = clean_frame(make_frame(["2024-05-01 10:30:00+08:00", "2024-05-01 08:30:00+08:00"]),
+                                CATEGORIES, time_column="提交时间")
+
+    assert batch.times == [datetime(2024, 5, 1, 10, 30), datetime(2024, 5, 1, 8, 30)]
+    assert all(time.tzinfo is None for time in batch.times)
+    assert not report.invalid_times
+    # EXIF 拍摄时间是当地时间：每行都与同一时刻拍摄的照片相差在容差之内
+    photos = [datetime(2024, 5, 1, 10, 31), datetime(2024, 5, 1, 8, 31)]
+    for captured, photo in zip(batch.times, photos):
+        assert abs(captured - photo) <= CAPTURE_TIME_TOLERANCE
+
+
+def test_mixed_offsets_and_naive_times():
+    """时区不统一、不带时区和无法识别的值混在一起时不报错，各自保留当地时间"""
+    frame = make_frame([
+        "2024-05-01 08:30:00+08:00",
+        "2024-05-01 10:30:00+09:00",
+        datetime(2024, 5, 2, 7, 0),
+        "2024-05-03 12:00",
+        "不是时间",
+        None,
+    ])
+    batch, report = clean_frame(frame, CATEGORIES, time_column="提交时间")
+
+    assert batch.times == [
+        datetime(2024, 5, 1, 8, 30),
+        datetime(2024, 5, 1, 10, 30),
+        datetime(2024, 5, 2, 7, 0),
+        datetime(2024, 5, 3, 12, 0),
+        None,
+        None,
+    ]
+    assert report.invalid_times == [(6, "不是时间")]
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据包清单测试 - 根目录中的成员和扩展名大小写
+"""
+
+import io
+import zipfile
+
+from zip_dataset import ZipDataset, ZipManifest
+
+
+def make_infos(names):
+    """构造只包含给定成员的压缩包，返回其中央目录清单"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name in names:
+            archive.writestr(name, b"" if name.endswith("/") else b"data")
+    with zipfile.ZipFile(buffer) as archive:
+        return archive.infolist()
+
+
+def test_root_level_members():
+    """根目录中的图片和 Excel 不影响图片文件夹的识别"""
+    manifest = ZipManifest(make_infos([
+        "thumbnail.jpeg",
+        "巡厂.xlsx",
+        "Files/",
+        "Files/待整改--现场图片/",
+        "Files/待整改--现场图片/门口漏雨.jpeg",
+        "Files/待整改--现场图片/地面油污.jpeg",
+    ]))
+
+    assert manifest.folders[""] == ["thumbnail.jpeg"]
+    assert manifest.folder_sizes[""] == 4
+    assert manifest.workbooks == ["巡厂.xlsx"]
+    assert manifest.rank_folders()[0] == "Files/待整改--现场图片"
+
+
+def test_only_root_images():
+    """图片都在根目录时以根目录作为图片文件夹"""
+    manifest = ZipManifest(make_infos(["巡厂.xlsx", "门口漏雨.jpeg", "地面油污.jpeg"]))
+
+    assert manifest.rank_folders() == [""]
+    assert sorted(manifest.folders[""]) == ["地面油污.jpeg", "门口漏雨.jpeg"]
+
+
+def test_suffixes_ignore_case():
+    """大写扩展名的图片和 Excel 也被收录"""
+    manifest = ZipManifest(make_infos(["巡厂.XLSX", "图片/门口漏雨.JPEG", "图片/地面油污.jpeg"]))
+
+    assert manifest.workbooks == ["巡厂.XLSX"]
+    assert sorted(manifest.folders["图片"]) == ["图片/地面油污.jpeg", "图片/门口漏雨.JPEG"]
+
+
+def test_dataset_with_root_image(tmp_path):
+    """根目录中多出一张图片的数据包可以正常打开"""
+    path = tmp_path / "gemba.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("thumbnail.jpeg", b"data")
+        archive.writestr("Files/待整改--现场图片/门口漏雨.jpeg", b"data")
+
+    with ZipDataset(path) as dataset:
+        assert dataset.image_folder == "Files/待整改--现场图片"
+        assert [image.name for image in dataset.images] == ["门口漏雨.jpeg"]
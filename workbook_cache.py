@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+巡厂数据缓存 - 同一个 Excel 再次生成时不再解析
+
+清理后的数据批次（InspectionBatch，本身按列保存）与校验报告一起写入一个 pickle 文件，
+文件名由 Excel 内容的哈希和读取选项（工作表、分类、附件列和时间列候选等）计算得到。
+只修改 PPT 模板后重新生成时直接读取缓存，不再打开工作簿。
+缓存文件总大小超过 max_bytes 时按最近使用时间淘汰。
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from match_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+# 巡厂数据缓存的容量（字节）
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# 计算内容哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(source):
+    """
+    计算 Excel 内容的哈希
+
+    Args:
+        source: 数据文件路径或内存流
+
+    Returns:
+        str: SHA1 十六进制字符串
+    """
+    digest = hashlib.sha1()
+    if hasattr(source, "getbuffer"):
+        digest.update(source.getbuffer())
+    elif hasattr(source, "read"):
+        position = source.tell()
+        for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        source.seek(position)
+    else:
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WorkbookCache:
+    """清理后巡厂数据的文件缓存，超出容量时淘汰最久未使用的文件"""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Args:
+            cache_dir (Path): 缓存目录，默认为 DEFAULT_CACHE_DIR
+            max_bytes (int): 缓存文件的总大小上限（字节）
+        """
+        self.root = Path(cache_dir or DEFAULT_CACHE_DIR) / "workbooks"
+        self.max_bytes = max_bytes
+
+    def key(self, source, options):
+        """
+        由 Excel 内容和读取选项计算缓存键
+
+        Args:
+            source: 数据文件路径或内存流
+            options (tuple): 影响读取结果的选项，需要有稳定的 repr
+
+        Returns:
+            str: 缓存键
+        """
+        return hashlib.sha1(f"{content_hash(source)}:{options!r}".encode("utf-8")).hexdigest()
+
+    def load(self, key):
+        """
+        读取缓存
+
+        Returns:
+            tuple or None: (InspectionBatch, ValidationReport)，没有缓存时返回 None
+        """
+        path = self.root / f"{key}.pkl"
+        try:
+            with open(path, "rb") as f:
+                batch, report = pickle.load(f)
+            # 更新修改时间作为最近使用时间
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.PickleError, EOFError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"读取巡厂数据缓存失败: {e}")
+            return None
+        return batch, report
+
+    def store(self, key, batch, report):
+        """写入缓存并按容量淘汰旧文件"""
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((batch, report), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_name, self.root / f"{key}.pkl")
+            self.evict()
+        except OSError as e:
+            logger.warning(f"写入巡厂数据缓存失败: {e}")
+
+    def evict(self):
+        """删除最久未使用的缓存文件，使总大小不超过 max_bytes"""
+        entries = []
+        for path in self.root.glob("*.pkl"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Excel 内嵌图片读取 - 直接从 .xlsx 压缩包中读取图片及其所在行
+
+部分表单工具导出时把现场图片直接嵌入工作表，而不是单独提供图片文件夹。
+本模块按 工作簿 -> 工作表 -> 绘图 -> 图片 的关系链解析锚点坐标，
+得到每张图片所在的 Excel 行号，图片内容在需要时才从压缩包中读出，不写入磁盘。
+"""
+
+import io
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "xdr": "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+}
+
+_R_ID = f"{{{NS['r']}}}id"
+_R_EMBED = f"{{{NS['r']}}}embed"
+
+
+class EmbeddedImage:
+    """工作簿中的一张内嵌图片，内容按需读取"""
+
+    def __init__(self, workbook_path, member):
+        self.workbook_path = workbook_path
+        self.member = member
+        self.name = posixpath.basename(member)
+
+    @property
+    def stem(self):
+        return posixpath.splitext(self.name)[0]
+
+    @property
+    def key(self):
+        """图片来源的唯一标识：所在工作簿和部件"""
+        return (str(self.workbook_path), self.member)
+
+    def read(self):
+        """从工作簿压缩包中读取图片字节"""
+        if self.workbook_path is None:
+            return self._data
+        with zipfile.ZipFile(self.workbook_path) as workbook:
+            return workbook.read(self.member)
+
+    def __getstate__(self):
+        # 工作簿在内存中时（从数据包中读出），不把整个工作簿传给预处理进程，只传这张图片
+        state = dict(self.__dict__)
+        if hasattr(self.workbook_path, "read"):
+            state["_data"] = self.read()
+            state["workbook_path"] = None
+        return state
+
+    def __repr__(self):
+        return f"EmbeddedImage({self.member!r})"
+
+
+def _part_rels(workbook, part):
+    """读取某个部件的关系表，返回 {rId: 目标部件路径}"""
+    directory, name = posixpath.split(part)
+    rels_path = posixpath.join(directory, "_rels", name + ".rels")
+    if rels_path not in workbook.NameToInfo:
+        return {}
+
+    targets = {}
+    root = ET.fromstring(workbook.read(rels_path))
+    for rel in root.findall("rel:Relationship", NS):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            target = target.lstrip("/")
+        else:
+            target = posixpath.normpath(posixpath.join(directory, target))
+        targets[rel.get("Id")] = target
+    return targets
+
+
+def _first_sheet_part(workbook):
+    """返回第一个工作表（pandas 默认读取的工作表）的部件路径"""
+    root = ET.fromstring(workbook.read("xl/workbook.xml"))
+    sheet = root.find("main:sheets/main:sheet", NS)
+    if sheet is None:
+        return None
+    return _part_rels(workbook, "xl/workbook.xml").get(sheet.get(_R_ID))
+
+
+def has_embedded_images(excel_path):
+    """工作簿中是否包含图片部件"""
+    try:
+        with zipfile.ZipFile(excel_path) as workbook:
+            return any(name.startswith("xl/media/") for name in workbook.namelist())
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+def read_embedded_images(excel_path):
+    """
+    读取第一个工作表中锚定在单元格上的图片
+
+    Args:
+        excel_path (Path): Excel 文件路径或内存流
+
+    Returns:
+        dict: {Excel 行号（从 1 开始）: EmbeddedImage}，同一行有多张图片时取最左边的一张
+    """
+    images = {}
+    try:
+        workbook = zipfile.ZipFile(excel_path)
+    except zipfile.BadZipFile:
+        # CSV、Parquet 等数据文件没有内嵌图片
+        return images
+    with workbook:
+        sheet_part = _first_sheet_part(workbook)
+        if not sheet_part or sheet_part not in workbook.NameToInfo:
+            return images
+
+        sheet_rels = _part_rels(workbook, sheet_part)
+        sheet_root = ET.fromstring(workbook.read(sheet_part))
+
+        anchors = []
+        for drawing in sheet_root.findall("main:drawing", NS):
+            drawing_part = sheet_rels.get(drawing.get(_R_ID))
+            if not drawing_part or drawing_part not in workbook.NameToInfo:
+                continue
+            drawing_rels = _part_rels(workbook, drawing_part)
+            drawing_root = ET.fromstring(workbook.read(drawing_part))
+
+            for anchor in list(drawing_root):
+                start = anchor.find("xdr:from", NS)
+                blip = anchor.find(".//xdr:pic/xdr:blipFill/a:blip", NS)
+                if start is None or blip is None:
+                    continue
+                media = drawing_rels.get(blip.get(_R_EMBED))
+                if not media or media not in workbook.NameToInfo:
+                    continue
+                row = int(start.findtext("xdr:row", "0", NS)) + 1
+                column = int(start.findtext("xdr:col", "0", NS))
+                anchors.append((row, column, media))
+
+    for row, _, media in sorted(anchors):
+        images.setdefault(row, EmbeddedImage(excel_path, media))
+    return images
+
+
+def picture_source(image):
+    """返回 add_picture 可用的图片来源：内嵌图片和压缩包中的图片为内存流，其余为文件路径字符串"""
+    if hasattr(image, "read"):
+        return io.BytesIO(image.read())
+    return str(image)
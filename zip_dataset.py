@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ZIP 数据包 - 不解压，直接从压缩包中读取 Excel 和图片
+
+上传的数据包（Excel 或表单系统导出的 CSV/Parquet + 现场图片文件夹）不再整体解压到临时目录。
+磁盘上的压缩包通过 mmap 打开，内存中的上传文件直接使用；
+只遍历一次中央目录建立清单（ZipManifest），从中确定 Excel 和图片文件夹，
+图片内容只在真正需要时（匹配到某一行之后）才通过 ZipFile.open 解压到内存。
+"""
+
+import io
+import mmap
+import posixpath
+import zipfile
+from pathlib import Path
+
+from image_matcher import IMAGE_SUFFIXES, ImageIndex
+from image_probe import HEADER_READ_LIMIT, header_size
+
+# 巡厂数据文件的扩展名
+DATA_SUFFIXES = (".xlsx", ".csv", ".parquet")
+
+# 图片文件夹名称中的关键字
+IMAGE_FOLDER_KEYWORDS = ("图片", "照片")
+
+# 数据包的读取上限，在中央目录中检查，超出时在开始处理前报错
+MAX_TOTAL_SIZE = 1024 * 1024 * 1024   # 解压后的总大小（字节）
+MAX_MEMBERS = 10000                    # 成员数量
+MAX_MEMBER_SIZE = 64 * 1024 * 1024    # 单个 Excel 或图片解压后的大小（字节）
+MAX_IMAGE_PIXELS = 100_000_000         # 单张图片的像素数
+
+# 成员名使用 UTF-8 编码的标志位
+_UTF8_FLAG = 0x800
+
+
+class ArchiveLimitError(ValueError):
+    """数据包超出读取上限"""
+
+
+def _megabytes(size):
+    return f"{size / (1024 * 1024):.0f} MB"
+
+
+class _MappedFile(mmap.mmap):
+    """只读内存映射的压缩包文件，补上 ZipFile 需要的 seekable()"""
+
+    def seekable(self):
+        return True
+
+
+# 预处理进程中按路径重新打开的数据包，每个进程每个压缩包只打开一次
+_reopened = {}
+
+
+def _reopen(path):
+    dataset = _reopened.get(path)
+    if dataset is None:
+        dataset = _reopened[path] = ZipDataset(path)
+    return dataset
+
+
+class ZipImage:
+    """压缩包中的一张图片，内容按需解压"""
+
+    def __init__(self, dataset, member, info):
+        self.dataset = dataset
+        self.member = member
+        self.name = posixpath.basename(member)
+        self.file_size = info.file_size
+        self.crc = info.CRC
+        self._dataset_key = dataset.key
+        self._data = None
+
+    @property
+    def stem(self):
+        return posixpath.splitext(self.name)[0]
+
+    @property
+    def key(self):
+        """图片来源的唯一标识：数据包和成员名"""
+        return (self._dataset_key, self.member)
+
+    def read(self):
+        """解压并返回图片字节"""
+        if self._data is not None:
+            return self._data
+        return self.dataset.read(self.member)
+
+    def read_header(self, limit):
+        """只解压图片开头的 limit 个字节"""
+        if self._data is not None:
+            return self._data[:limit]
+        return self.dataset.read_header(self.member, limit)
+
+    def __getstate__(self):
+        # 传给预处理进程时：磁盘上的压缩包只传路径，由进程自己打开；
+        # 上传到内存中的压缩包无法共享，直接传解压后的图片字节
+        state = dict(self.__dict__)
+        state["dataset"] = self.dataset.path if self.dataset is not None else None
+        if state["dataset"] is None:
+            state["_data"] = self.read()
+        return state
+
+    def __setstate__(self, state):
+        path = state.pop("dataset")
+        self.__dict__.update(state)
+        self.dataset = _reopen(path) if path is not None else None
+
+    def __repr__(self):
+        return f"ZipImage({self.member!r})"
+
+
+def decode_member_name(info):
+    """
+    解码成员名
+
+    没有设置 UTF-8 标志的成员名被 zipfile 按 CP437 解码；Windows 中文系统打包的文件名
+    实际是 GBK，部分工具写入的是不带标志的 UTF-8。这里还原原始字节后依次尝试 UTF-8 和 GBK。
+
+    Args:
+        info (ZipInfo): 成员信息
+
+    Returns:
+        str: 成员名
+    """
+    if info.flag_bits & _UTF8_FLAG:
+        return info.filename
+    try:
+        raw = info.filename.encode("cp437")
+    except UnicodeEncodeError:
+        return info.filename
+    for encoding in ("utf-8", "gbk"):
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return info.filename
+
+
+def _ignored(name):
+    """macOS 压缩时附带的资源文件和 Excel 的临时锁文件"""
+    basename = posixpath.basename(name)
+    return name.startswith("__MACOSX/") or basename.startswith("._") or basename.startswith("~$")
+
+
+class ZipManifest:
+    """一次遍历中央目录得到的数据包清单：数据文件（Excel、CSV、Parquet）候选、按文件夹分组的图片和大小"""
+
+    def __init__(self, infos, image_suffixes=IMAGE_SUFFIXES):
+        """
+        Args:
+            infos (list): ZipFile.infolist() 的结果
+            image_suffixes (tuple): 图片扩展名（不区分大小写）
+        """
+        image_suffixes = tuple(suffix.lower() for suffix in image_suffixes)
+        self.members = {}
+        self.workbooks = []
+        self.folders = {}
+        self.folder_sizes = {}
+        self.member_count = len(infos)
+        self.total_size = sum(info.file_size for info in infos)
+
+        for info in infos:
+            name = decode_member_name(info)
+            if _ignored(name):
+                continue
+            if info.is_dir():
+                self._add_folder(name.rstrip("/"))
+                continue
+
+            self.members[name] = info
+            folder = posixpath.dirname(name)
+            self._add_folder(folder)
+            suffix = posixpath.splitext(name)[1].lower()
+            if suffix in DATA_SUFFIXES:
+                self.workbooks.append(name)
+            elif suffix in image_suffixes:
+                # 压缩包根目录（""）不由 _add_folder 记录，有图片时才登记
+                self.folders.setdefault(folder, []).append(name)
+                self.folder_sizes[folder] = self.folder_sizes.get(folder, 0) + info.file_size
+
+        # 层级浅的数据文件优先，同一层级按出现顺序
+        self.workbooks.sort(key=lambda name: name.count("/"))
+
+    def _add_folder(self, folder):
+        """记录文件夹及其所有上级文件夹（按出现顺序）"""
+        while folder and folder not in self.folders:
+            self.folders[folder] = []
+            self.folder_sizes[folder] = 0
+            folder = posixpath.dirname(folder)
+
+    def rank_folders(self):
+        """
+        按图片文件夹的可能性排序：名称含"图片"/"照片"的优先，其次直接包含图片的，
+        图片多的优先，其余按出现顺序；既不含关键字也没有图片的文件夹不参与
+
+        Returns:
+            list: 文件夹名列表，最可能的在前
+        """
+        ranked = []
+        for order, (folder, images) in enumerate(self.folders.items()):
+            named = any(keyword in posixpath.basename(folder) for keyword in IMAGE_FOLDER_KEYWORDS)
+            if named or images:
+                ranked.append((not named, not images, -len(images), order, folder))
+        return [item[-1] for item in sorted(ranked)]
+
+
+class ZipDataset:
+    """不解压的 ZIP 数据包"""
+
+    def __init__(self, source, image_suffixes=IMAGE_SUFFIXES, max_total_size=MAX_TOTAL_SIZE,
+                 max_members=MAX_MEMBERS, max_member_size=MAX_MEMBER_SIZE):
+        """
+        打开数据包并从中央目录清单中确定 Excel 文件和图片文件夹
+
+        Args:
+            source: 压缩包路径，或可 seek 的文件对象（如 Streamlit 上传的文件）
+            image_suffixes (tuple): 图片扩展名
+            max_total_size (int): 解压后总大小的上限（字节）
+            max_members (int): 成员数量的上限
+            max_member_size (int): 单个 Excel 或图片解压后大小的上限（字节）
+
+        Raises:
+            ArchiveLimitError: 数据包超出上限，此时不会读取任何成员内容
+        """
+        self._file = None
+        self._mmap = None
+        self._zip = None
+        # 任何一步失败（如 BadZipFile、空文件无法映射、超出上限）都关闭已经打开的文件和映射
+        try:
+            if isinstance(source, (str, Path)):
+                self.path = str(source)
+                self.key = self.path
+                self._file = open(self.path, "rb")
+                self._mmap = _MappedFile(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._zip = zipfile.ZipFile(self._mmap)
+            else:
+                self.path = None
+                self.key = f"upload:{id(source)}"
+                self._zip = zipfile.ZipFile(source)
+
+            self.manifest = ZipManifest(self._zip.infolist(), image_suffixes)
+            self.workbook_member = self.manifest.workbooks[0] if self.manifest.workbooks else None
+            folders = self.manifest.rank_folders()
+            self.image_folder = folders[0] if folders else None
+            self.images = []
+            if self.image_folder is not None:
+                self.images = [ZipImage(self, name, self.manifest.members[name])
+                               for name in sorted(self.manifest.folders[self.image_folder])]
+
+            self._check_limits(max_total_size, max_members, max_member_size)
+        except BaseException:
+            self.close()
+            raise
+
+    def _check_limits(self, max_total_size, max_members, max_member_size):
+        """按中央目录中记录的大小检查上限"""
+        manifest = self.manifest
+        if manifest.member_count > max_members:
+            raise ArchiveLimitError(
+                f"数据包中有 {manifest.member_count} 个文件，超过上限 {max_members} 个，请分批上传")
+        if manifest.total_size > max_total_size:
+            raise ArchiveLimitError(
+                f"数据包解压后共 {_megabytes(manifest.total_size)}，超过上限 {_megabytes(max_total_size)}，"
+                "请压缩图片或分批上传")
+
+        members = [image.member for image in self.images]
+        if self.workbook_member is not None:
+            members.append(self.workbook_member)
+        for member in members:
+            size = manifest.members[member].file_size
+            if size > max_member_size:
+                raise ArchiveLimitError(
+                    f"文件 {member} 解压后为 {_megabytes(size)}，超过单个文件上限 {_megabytes(max_member_size)}")
+
+    def check_pixels(self, images, max_pixels=MAX_IMAGE_PIXELS):
+        """
+        检查图片的像素数，只解压每张图片的文件头
+
+        Args:
+            images (list): 需要检查的图片（如匹配到的图片）
+            max_pixels (int): 单张图片像素数的上限
+
+        Raises:
+            ArchiveLimitError: 有图片超出上限
+        """
+        for image in images:
+            if not isinstance(image, ZipImage):
+                continue
+            size = header_size(image.read_header(HEADER_READ_LIMIT))
+            if size and size[0] * size[1] > max_pixels:
+                raise ArchiveLimitError(
+                    f"图片 {image.name} 为 {size[0]}x{size[1]} 像素，超过单张图片上限 "
+                    f"{max_pixels // 1_000_000} 百万像素，请缩小后重新上传")
+
+    def read(self, member):
+        """解压一个成员"""
+        return self._zip.read(self.manifest.members[member])
+
+    def read_header(self, member, limit):
+        """只解压成员开头的 limit 个字节"""
+        with self._zip.open(self.manifest.members[member]) as f:
+            return f.read(limit)
+
+    def open_workbook(self):
+        """
+        把 Excel（或 CSV、Parquet）文件解压到内存
+
+        Returns:
+            BytesIO or None: 文件内容，name 属性为文件名（用于判断格式），数据包中没有数据文件时返回 None
+        """
+        if self.workbook_member is None:
+            return None
+        workbook = io.BytesIO(self.read(self.workbook_member))
+        workbook.name = posixpath.basename(self.workbook_member)
+        return workbook
+
+    def index(self):
+        """
+        用图片文件夹中的图片建立索引，指纹由文件名、大小和 CRC 计算，不解压任何图片
+
+        Returns:
+            ImageIndex: 图片索引
+        """
+        stats = [(image.file_size, image.crc) for image in self.images]
+        return ImageIndex.from_paths(self.images, stats=stats)
+
+    def close(self):
+        """关闭压缩包"""
+        if self._zip is not None:
+            self._zip.close()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
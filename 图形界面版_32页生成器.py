@@ -23,13 +23,29 @@ import re
 
 # 导入库
 from pptx import Presentation
-from pptx.util import Inches
 from pptx.enum.shapes import MSO_SHAPE_TYPE
-import pandas as pd  # 用于Excel读取
+
+from image_cache import PreparedImageCache
+from image_matcher import ATTACHMENT_COLUMNS, TIMESTAMP_COLUMNS, match_rows
+from image_prep import ImagePreparer
+from inspection_records import InspectionBatch
+from inspection_validation import load_inspection_rows
+from match_cache import MatchCache
+from photo_dedupe import PhotoDeduper
+from scratch import default_scratch_space
+from slide_pictures import LINKED_PHOTO_FOLDER, PicturePlacer
+from workbook_cache import WorkbookCache
+from xlsx_images import has_embedded_images, read_embedded_images
+from zip_dataset import ArchiveLimitError, ZipDataset
 
 # 配置文件路径
 CONFIG_FILE = "gemba_config.json"
 
+# 幻灯片左侧图片区域的位置和大小（英寸）
+PICTURE_LEFT = 0.5
+PICTURE_TOP = 2.1
+PICTURE_BOX = (3.5, 2.8)
+
 def load_config():
     """加载配置文件"""
     try:
@@ -95,50 +111,43 @@ def select_files():
     print("警告: 原GUI版本已禁用，请使用Web界面或直接调用generate_ppt_with_user_files")
     return None, None, None
 
-def read_excel_data(excel_path):
-    """从Excel文件动态读取数据，替代硬编码数据"""
+def read_excel_data(excel_path, attachment_columns=ATTACHMENT_COLUMNS):
+    """从Excel文件动态读取数据，替代硬编码数据
+    
+    返回按列保存的 InspectionBatch。如果存在附件列（attachment_columns 中第一个存在的列），
+    其内容保存在每行的 attachment 字段中，用于直接关联图片；
+    如果存在时间列（TIMESTAMP_COLUMNS），保存在 captured 字段中，用于按拍摄时间匹配图片。
+    """
     try:
-        print(f"正在读取Excel文件: {excel_path}")
-        
-        # 使用pandas读取Excel文件
-        df = pd.read_excel(excel_path)
-        print(f"Excel文件读取成功，共 {len(df)} 行数据")
-        
-        # 数据验证：检查必需的列是否存在
-        required_columns = ["问题发现区域", "发现人", "问题收集", "问题分类"]
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            print(f"警告：Excel文件缺少必需列: {missing_columns}")
-            # 使用默认值填充缺失列
-            for col in missing_columns:
-                df[col] = "未知"
-        
-        # 过滤空行和无效数据
-        df_cleaned = df.dropna(subset=["问题收集"]).copy()
-        print(f"清理后有效数据: {len(df_cleaned)} 行")
-        
-        # 转换为标准格式
-        data_list = []
-        for _, row in df_cleaned.iterrows():
-            data_row = {
-                "问题发现区域": str(row.get("问题发现区域", "未知")).strip(),
-                "发现人": str(row.get("发现人", "未知")).strip(),
-                "问题收集": str(row.get("问题收集", "")).strip(),
-                "问题分类": str(row.get("问题分类", "Others")).strip()
-            }
-            # 只添加非空的问题记录
-            if data_row["问题收集"]:
-                data_list.append(data_row)
-        
-        print(f"最终处理数据: {len(data_list)} 行")
-        return data_list
+        print(f"正在读取Excel文件: {getattr(excel_path, 'name', excel_path)}")
+        
+        # 只读方式读取需要的列，按列清理并校验
+        batch, report = load_inspection_rows(excel_path, get_category_mapping(), attachment_columns,
+                                             TIMESTAMP_COLUMNS, cache=WorkbookCache())
+        print(f"Excel文件读取成功，共 {report.total_rows} 行数据（{report.backend}）")
+        
+        if report.missing_columns:
+            print(f"警告：Excel文件缺少必需列: {report.missing_columns}，使用默认值填充")
+        if report.attachment_column:
+            print(f"检测到附件列: {report.attachment_column}，将按附件直接关联图片")
+        if report.time_column:
+            print(f"检测到时间列: {report.time_column}")
+        
+        # 在生成幻灯片之前列出有问题的行
+        issues = report.issues()
+        if issues:
+            print(f"数据校验: {report.summary()}")
+            for issue in issues:
+                print(f"    第 {issue['行号']} 行: {issue['问题']} {issue['内容']}")
+        
+        print(f"最终处理数据: {len(batch)} 行")
+        return batch
         
     except Exception as e:
         print(f"读取Excel文件失败: {e}")
         print("使用备用硬编码数据...")
         # 发生错误时返回原有的硬编码数据作为备用
-        return get_all_31_rows_backup()
+        return InspectionBatch.from_rows(get_all_31_rows_backup())
 
 def get_all_31_rows_backup():
     """备用硬编码数据函数（原get_all_31_rows重命名）"""
@@ -188,39 +197,6 @@ def get_category_mapping():
         "Others": "G"
     }
 
-def find_matching_image(problem_description, images_path):
-    """增强的图片匹配函数"""
-    if not problem_description or not images_path.exists():
-        return None
-    
-    # 方法1: 精确匹配
-    for img_file in images_path.glob("*.jpeg"):
-        if problem_description in img_file.stem:
-            return img_file
-    
-    # 方法2: 反向匹配
-    for img_file in images_path.glob("*.jpeg"):
-        img_name = img_file.stem
-        if img_name in problem_description:
-            return img_file
-    
-    # 方法3: 清理特殊字符后匹配
-    problem_clean = problem_description.replace(" ", "").replace("，", "").replace("。", "")
-    for img_file in images_path.glob("*.jpeg"):
-        img_clean = img_file.stem.replace("_", "").replace("-", "").replace("--", "")
-        if problem_clean in img_clean or img_clean in problem_clean:
-            return img_file
-    
-    # 方法4: 关键词匹配
-    keywords = problem_description.split()
-    for img_file in images_path.glob("*.jpeg"):
-        img_name = img_file.stem
-        for keyword in keywords:
-            if len(keyword) > 1 and keyword in img_name:
-                return img_file
-    
-    return None
-
 def handle_circle_markers(slide, target_category):
     """处理圆形标记 A-G 系统"""
     category_mapping = get_category_mapping()
@@ -267,68 +243,66 @@ def handle_circle_markers(slide, target_category):
     else:
         print(f"    [!] 未找到目标圆圈: {target_letter}")
 
-def extract_zip_and_find_files(zip_path):
-    """解压ZIP文件并查找Excel和图片"""
-    import zipfile
-    import tempfile
-    
+def open_zip_and_find_files(zip_path):
+    """打开ZIP文件并查找Excel和图片，不解压到磁盘
+
+    Returns:
+        tuple: (ZipDataset, Excel 文件内存流)，失败时为 (None, None)
+    """
+    dataset = None
     try:
-        zip_path = Path(zip_path)
-        temp_dir = Path(tempfile.mkdtemp())
-        
-        # 解压ZIP文件
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        print(f"ZIP文件已解压到: {temp_dir}")
+        dataset = ZipDataset(zip_path)
         
         # 查找Excel文件
-        excel_files = list(temp_dir.rglob("*.xlsx"))
-        if not excel_files:
-            raise FileNotFoundError("未在ZIP文件中找到Excel文件")
-        
-        excel_path = excel_files[0]
-        print(f"找到Excel文件: {excel_path}")
+        excel_file = dataset.open_workbook()
+        if excel_file is None:
+            raise FileNotFoundError("未在ZIP文件中找到Excel、CSV或Parquet文件")
+        print(f"找到数据文件: {dataset.workbook_member}")
         
         # 查找图片文件夹
-        image_folders = []
-        for folder in temp_dir.rglob("*"):
-            if folder.is_dir() and ("图片" in folder.name or "照片" in folder.name):
-                image_folders.append(folder)
-        
-        if not image_folders:
-            # 如果没有找到专门的图片文件夹，查找包含jpeg文件的文件夹
-            for folder in temp_dir.rglob("*"):
-                if folder.is_dir() and list(folder.glob("*.jpeg")):
-                    image_folders.append(folder)
-        
-        if not image_folders:
+        if dataset.image_folder is None:
+            # 图片直接嵌入在Excel中时不需要单独的图片文件夹
+            if has_embedded_images(excel_file):
+                print("未找到图片文件夹，将使用Excel内嵌图片")
+                return dataset, excel_file
             raise FileNotFoundError("未在ZIP文件中找到图片文件夹")
         
-        images_path = image_folders[0]
-        print(f"找到图片文件夹: {images_path}")
+        print(f"找到图片文件夹: {dataset.image_folder}（{len(dataset.images)} 张图片）")
         
-        return excel_path, images_path, temp_dir
+        return dataset, excel_file
         
     except Exception as e:
-        print(f"解压ZIP文件失败: {e}")
-        return None, None, None
+        if dataset is not None:
+            dataset.close()
+        print(f"读取ZIP文件失败: {e}")
+        return None, None
+
+def generate_ppt_with_user_files(ppt_file, zip_file, output_folder, use_capture_time=False, dedupe_photos=False,
+                                 link_photos=False):
+    """使用用户选择的文件生成PPT
 
-def generate_ppt_with_user_files(ppt_file, zip_file, output_folder):
-    """使用用户选择的文件生成PPT"""
+    use_capture_time 为 True 时，其余方式都没有匹配到的行再按照片拍摄时间匹配；
+    dedupe_photos 为 True 时，近似重复的照片只嵌入一份；
+    link_photos 为 True 时生成精简版：在输出位置创建文件包文件夹，
+    其中的PPT以相对路径链接同一文件夹下的图片
+    """
     print("开始生成PPT...")
     
+    # 本次生成的临时目录，结束时（包括出错和中断）删除
+    scratch = default_scratch_space().job("gui")
+    dataset = preparer = None
+    
     try:
-        # 解压ZIP文件并查找相关文件
-        excel_path, images_path, temp_dir = extract_zip_and_find_files(zip_file)
+        # 直接读取ZIP文件并查找相关文件，图片在用到时才从压缩包中解压
+        dataset, excel_path = open_zip_and_find_files(zip_file)
         
-        if not excel_path or not images_path:
-            print("无法找到Excel文件或图片文件夹")
+        if not excel_path:
+            print("无法找到数据文件")
             return None
         
-        # 显示找到的图片数量
-        images = list(images_path.glob("*.jpeg"))
-        print(f"发现 {len(images)} 张图片")
+        # 一次性建立图片索引，并显示找到的图片数量
+        image_index = dataset.index()
+        print(f"发现 {len(image_index)} 张图片")
         
         # 加载PPT模板
         prs = Presentation(ppt_file)
@@ -358,12 +332,40 @@ def generate_ppt_with_user_files(ppt_file, zip_file, output_folder):
             
         template_slide = prs.slides[1]
         
+        # 确定每行的图片：先用内嵌图片和附件关联，再查匹配缓存，其余批量一对一分配
+        embedded_images = read_embedded_images(excel_path)
+        if embedded_images:
+            print(f"Excel内嵌图片: {len(embedded_images)} 张")
+        row_matches = match_rows(data, image_index, MatchCache(scope="app"), embedded_images,
+                                 use_capture_time)
+        print(f"匹配到图片: {sum(1 for path, _, _ in row_matches if path)}/{len(data)} 行")
+        
+        # 处理前检查匹配到的图片尺寸，超大图片直接报错而不是耗尽内存
+        try:
+            dataset.check_pixels(path for path, _, _ in row_matches if path)
+        except ArchiveLimitError as e:
+            print(f"错误: {e}")
+            return None
+        
+        # 在后台进程中预处理图片（使用缓存），与幻灯片构建同时进行
+        preparer = ImagePreparer(PICTURE_BOX, cache=PreparedImageCache())
+        preparer.submit(path for path, _, _ in row_matches if path)
+        deduper = PhotoDeduper() if dedupe_photos else None
+        current_date_str = datetime.now().strftime("%Y%m%d")
+        if link_photos:
+            # 精简版：图片写入文件包中的图片文件夹，PPT 中只保存相对路径链接
+            bundle_dir = Path(output_folder) / f"Gemba巡厂报告{current_date_str}"
+            placer = PicturePlacer(preparer, deduper, link_dir=bundle_dir / LINKED_PHOTO_FOLDER)
+        else:
+            # 图片部件内容暂存在临时目录中，保存时才读入，内存占用不随图片数量增长
+            placer = PicturePlacer(preparer, deduper, spool_dir=scratch.subdir("parts"), scratch=scratch)
+        
         # 为每行数据创建幻灯片
         created_count = 0
         images_found = 0
         
         for i, row in enumerate(data, 1):
-            print(f"\n创建第 {i+1} 页: {row['问题收集'][:30]}...")
+            print(f"\n创建第 {i+1} 页: {row.description[:30]}...")
             
             try:
                 # 添加新幻灯片
@@ -384,41 +386,50 @@ def generate_ppt_with_user_files(ppt_file, zip_file, output_folder):
                         
                         # 替换占位符内容
                         if original_text == "模具":
-                            new_textbox.text_frame.text = row["问题发现区域"]
-                            print(f"    占位符1: 模具 -> {row['问题发现区域']}")
+                            new_textbox.text_frame.text = row.area
+                            print(f"    占位符1: 模具 -> {row.area}")
                         elif original_text == "-":
-                            new_textbox.text_frame.text = row["发现人"]
-                            print(f"    占位符2: - -> {row['发现人']}")
+                            new_textbox.text_frame.text = row.person
+                            print(f"    占位符2: - -> {row.person}")
                         elif "看板信息更新" in original_text or original_text == "看板信息更新":
-                            new_textbox.text_frame.text = row["问题收集"]
-                            print(f"    占位符4: {original_text} -> {row['问题收集']}")
+                            new_textbox.text_frame.text = row.description
+                            print(f"    占位符4: {original_text} -> {row.description}")
                         else:
                             new_textbox.text_frame.text = original_text
                 
                 # 处理圆形标记系统
-                handle_circle_markers(new_slide, row["问题分类"])
+                handle_circle_markers(new_slide, row.category)
                 
                 # 添加图片到左边 - 完美位置
-                image_path = find_matching_image(row["问题收集"], images_path)
+                image_path, score, method = row_matches[i - 1]
                 if image_path:
                     try:
-                        left = Inches(0.5)  # 左边位置
-                        top = Inches(2.1)   # 完美高度
-                        width = Inches(3.5)
-                        height = Inches(2.8)  # 完美高度
-                        new_slide.shapes.add_picture(str(image_path), left, top, width, height)
-                        print(f"    [V] 图片已添加: {image_path.name}")
+                        # 按图片实际宽高比放入图片区域，不拉伸；同一张图片只读取一次
+                        placer.add(new_slide, image_path, PICTURE_LEFT, PICTURE_TOP, PICTURE_BOX, i + 1)
+                        print(f"    [V] 图片已添加: {image_path.name} ({method}, 置信度 {score:.2f})")
                         images_found += 1
                     except Exception as e:
                         print(f"    [X] 图片添加失败: {e}")
                 else:
                     print(f"    [X] 未找到匹配图片")
+                    for path, candidate_score in image_index.fuzzy_candidates(row.description):
+                        print(f"        候选: {path.name} ({candidate_score:.2f})")
                 
                 created_count += 1
                 
             except Exception as e:
                 print(f"  创建第{i+1}页失败: {e}")
         
+        preparer.close()
+        dataset.close()
+        if preparer.cache_hits:
+            print(f"预处理图片缓存命中: {preparer.cache_hits} 张")
+        
+        # 列出共用同一张照片的页
+        if deduper:
+            for name, pages in deduper.shared_groups():
+                print(f"共用图片 {name}: 第 {'、'.join(map(str, pages))} 页")
+        
         # 删除原始的第二页模板幻灯片
         if len(prs.slides) > 1:
             try:
@@ -437,17 +448,13 @@ def generate_ppt_with_user_files(ppt_file, zip_file, output_folder):
                 print(f"删除模板幻灯片时发生错误: {e}")
         
         # 保存PPT - 使用简化的文件名
-        current_date_str = datetime.now().strftime("%Y%m%d")
         output_name = f"Gemba巡厂报告{current_date_str}.pptx"
+        if link_photos:
+            output_folder = bundle_dir
         output_path = Path(output_folder) / output_name
         
         prs.save(str(output_path))
         
-        # 清理临时文件
-        import shutil
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
-        
         print(f"\n[成功] 动态PPT生成成功!")
         print(f"文件: {output_name}")
         print(f"保存位置: {output_folder}")
@@ -480,6 +487,14 @@ def generate_ppt_with_user_files(ppt_file, zip_file, output_folder):
         print("==================")
         
         return None
+    
+    finally:
+        # 关闭图片预处理进程池和压缩包（包括提前返回和出错），清理临时文件
+        if preparer is not None:
+            preparer.close()
+        if dataset is not None:
+            dataset.close()
+        scratch.cleanup()
 
 def main():
     """主函数 - 带图形界面的PPT生成器"""